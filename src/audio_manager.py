@@ -1,69 +1,298 @@
+import os
+import wave
 import numpy as np
 from pydub import AudioSegment
 import threading
+from collections import deque, OrderedDict
 from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PyQt6.QtCore import QUrl, QObject, pyqtSignal
 
 import utils.logutils as log
 
 
+class DecodeJob:
+    """Richiesta di decodifica di un file. `cancelled` viene controllato tra una fase e l'altra."""
+    def __init__(self, path):
+        self.path = path
+        self.cancelled = threading.Event()
+
+
+class DecodedTrack:
+    """Traccia decodificata e analizzata, pronta per il passaggio atomico al player."""
+    def __init__(self, path, data, sample_rate, analysis):
+        self.path = path
+        self.data = data
+        self.sample_rate = sample_rate
+        self.analysis = analysis
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
 class AudioManager(QObject):
     # Segnale PUBBLICO: Emesso quando tutto è pronto (per la GUI)
     decoding_finished = pyqtSignal()
+    # Segnale PUBBLICO: Emesso quando una nuova traccia della playlist diventa attiva (path)
+    track_changed = pyqtSignal(str)
+    # Segnale PUBBLICO: Emesso quando la traccia corrente non è decodificabile e non ci sono
+    # tracce successive a cui passare (path)
+    decoding_failed = pyqtSignal(str)
 
     # Segnale INTERNO: Usato per passare i dati dal thread di calcolo decodifica al Main Thread
-    # Trasporta: (Array Numpy dei dati, Sample Rate intero)
-    _internal_data_ready = pyqtSignal(object, int)
+    # Trasporta: (DecodeJob, DecodedTrack)
+    _internal_data_ready = pyqtSignal(object, object)
+    # Segnale INTERNO: decodifica fallita per il DecodeJob
+    _internal_decode_failed = pyqtSignal(object)
 
-    def __init__(self):
+    def __init__(self, resource_manager=None, preload_ahead=2, memory_budget_mb=512):
         super().__init__()
-        
+
+        # Opzionale: assegna core dedicati e priorità bassa al thread di decodifica
+        self.resource_manager = resource_manager
+
         # Setup MediaPlayer -> riproduzione audio
         self.player = QMediaPlayer()
         self.audio_output = QAudioOutput()
         self.player.setAudioOutput(self.audio_output)
         self.audio_output.setVolume(1.0)
-        
+
         # Setup dati per l'IA
         self.full_audio_data = np.array([], dtype=np.float32)
         self.sample_rate = 44100
-        
+        self.current_analysis = {}
+        # Ultima posizione (s) interrogata sulla beat grid e grid di riferimento
+        self._last_event_time = None
+        self._last_event_grid = None
+
+        # Analisi eseguite nel thread di decodifica: callable(data, sr) -> dict
+        self.analyzers = []
+
+        # Playlist e cache delle tracce pre-decodificate (entro il budget di memoria)
+        self.playlist = []
+        self.current_index = -1
+        self.preload_ahead = preload_ahead
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._decoded = OrderedDict()
+        # Tracce non decodificabili: non vengono richieste di nuovo e si saltano in riproduzione
+        self._failed = set()
+        # Pre-decodifiche scartate per il budget: non si ripetono finché la traccia non diventa corrente
+        self._over_budget = set()
+        self._waiting_for_current = False
+        # True dopo una richiesta esplicita (set_playlist): la GUI avvia la riproduzione
+        self._notify_ready = False
+
+        # Worker unico e persistente con coda limitata di job cancellabili
+        self._jobs = deque()
+        self._in_flight = {}
+        self._jobs_cv = threading.Condition()
+        self._max_pending = preload_ahead + 1
+        self._worker = threading.Thread(target=self._decode_loop, name='pydub-decoder', daemon=True)
+        self._worker.start()
+
         # Connettiamo il segnale interno alla funzione che salva i dati
         self._internal_data_ready.connect(self._finalize_loading)
+        self._internal_decode_failed.connect(self._handle_decode_failure)
+
+    ### Playlist ###
 
     def load_file(self, file_path_str):
         """
-        Caricamento del file
-        - Configura il player.
-        - Avvia la decodifica in background.
+        Caricamento di un singolo file (playlist di un elemento).
+        Eventuali caricamenti precedenti ancora in corso vengono annullati.
         """
-        # Setup Player Qt
-        self.player.setSource(QUrl.fromLocalFile(file_path_str))
-        
-        # Reset dati vecchi
+        self.set_playlist([file_path_str])
+
+    def set_playlist(self, paths, start_index=0):
+        """
+        Imposta la playlist e avvia la decodifica della traccia iniziale
+        più la pre-decodifica delle successive.
+        """
+        self.playlist = list(paths)
+        self.current_index = start_index
+        self._failed.clear()
+        self._over_budget.clear()
+        self._notify_ready = True
+        self._cancel_jobs(keep=self._window_paths())
+        self._evict()
+        self._request_current()
+
+    def has_next(self):
+        return 0 <= self.current_index < len(self.playlist) - 1
+
+    def advance(self):
+        """
+        Passa alla traccia successiva (chiamato a fine traccia).
+        Se è già pre-decodificata il passaggio è immediato. Ritorna False a fine playlist.
+        """
+        if not self.has_next():
+            return False
+        self.current_index += 1
+        self._cancel_jobs(keep=self._window_paths())
+        self._request_current()
+        return True
+
+    @property
+    def current_path(self):
+        if 0 <= self.current_index < len(self.playlist):
+            return self.playlist[self.current_index]
+        return None
+
+    def _window_paths(self):
+        """Traccia corrente + le `preload_ahead` successive."""
+        start = max(self.current_index, 0)
+        return self.playlist[start:start + 1 + self.preload_ahead]
+
+    def _request_current(self):
+        path = self.current_path
+        if path is None:
+            return
+        # La traccia corrente si decodifica sempre, anche se oltre budget come pre-decodifica
+        self._over_budget.discard(path)
+
+        track = self._decoded.get(path)
+        if track is not None:
+            self._activate(track)
+        elif path in self._failed:
+            self._skip_failed_current()
+            return
+        else:
+            # Visual fermi finché la traccia corrente non è pronta
+            self.player.stop()
+            self.full_audio_data = np.array([], dtype=np.float32)
+            self._waiting_for_current = True
+            self._submit(path, priority=True)
+
+        self._schedule_preload()
+
+    def _schedule_preload(self):
+        """
+        Richiede la pre-decodifica delle tracce successive finché la memoria stimata
+        (tracce già decodificate + dimensione prevista delle altre) resta nel budget.
+        """
+        window = self._window_paths()
+        projected = sum(self._track_bytes(path) for path in window[:1])
+        for path in window[1:]:
+            if path in self._failed or path in self._over_budget:
+                continue
+            projected += self._track_bytes(path)
+            if path in self._decoded:
+                continue
+            if projected > self.memory_budget:
+                # Non si decodifica per poi scartare: si rivaluta al prossimo cambio traccia
+                projected -= self._track_bytes(path)
+                log.warning(f"Budget memoria: pre-decodifica saltata per {path}")
+                continue
+            self._submit(path)
+
+    def _track_bytes(self, path):
+        track = self._decoded.get(path)
+        return track.nbytes if track is not None else _estimate_decoded_bytes(path)
+
+    def _skip_failed_current(self):
+        """La traccia corrente non è decodificabile: passa alla successiva o si ferma."""
+        path = self.current_path
+        if self.advance():
+            log.warning(f"Traccia saltata: {path}")
+            return
+
+        # Fine playlist: niente da riprodurre, la GUI esce dallo stato di caricamento
+        self._waiting_for_current = False
+        self._notify_ready = False
+        self.player.stop()
+        self.player.setSource(QUrl())
         self.full_audio_data = np.array([], dtype=np.float32)
-        
-        # Avvia thread per decodifica file audio
-        worker_thread = threading.Thread(target=self._pydub_worker, args=(file_path_str,))
-        worker_thread.daemon = True 
-        worker_thread.start()
+        self.current_analysis = {}
+        self.decoding_failed.emit(path)
+
+    def _activate(self, track):
+        """Passaggio atomico (nel main thread): sorgente del player, dati e analisi insieme."""
+        self._waiting_for_current = False
+
+        self.player.setSource(QUrl.fromLocalFile(track.path))
+        self.full_audio_data, self.sample_rate = track.data, track.sample_rate
+        self.current_analysis = track.analysis
+        self._evict()
 
-    def _pydub_worker(self, file_path):
+        log.success(f"Dati Audio Pronti! Campioni: {len(track.data)}, SR: {track.sample_rate}")
+        if self._notify_ready:
+            self._notify_ready = False
+            self.decoding_finished.emit()
+        else:
+            self.player.play()
+        self.track_changed.emit(track.path)
+
+    ### Worker di decodifica ###
+
+    def _submit(self, path, priority=False):
+        with self._jobs_cv:
+            in_flight = self._in_flight.get(path)
+            if in_flight is not None and not in_flight.cancelled.is_set():
+                return
+            if any(job.path == path for job in self._jobs):
+                return
+            if not priority and len(self._jobs) >= self._max_pending:
+                return
+            job = DecodeJob(path)
+            if priority:
+                self._jobs.appendleft(job)
+            else:
+                self._jobs.append(job)
+            self._jobs_cv.notify()
+
+    def _cancel_jobs(self, keep=()):
+        """Annulla i job (in coda o in corso) per tracce non più necessarie."""
+        keep = set(keep)
+        with self._jobs_cv:
+            for job in list(self._jobs):
+                if job.path not in keep:
+                    job.cancelled.set()
+                    self._jobs.remove(job)
+            for path, job in self._in_flight.items():
+                if path not in keep:
+                    job.cancelled.set()
+
+    def _decode_loop(self):
+        if self.resource_manager is not None:
+            self.resource_manager.setup_decode_thread()
+
+        while True:
+            with self._jobs_cv:
+                while not self._jobs:
+                    self._jobs_cv.wait()
+                job = self._jobs.popleft()
+                self._in_flight[job.path] = job
+
+            try:
+                track = self._pydub_worker(job)
+                if track is not None:
+                    self._internal_data_ready.emit(job, track)
+                elif not job.cancelled.is_set():
+                    self._internal_decode_failed.emit(job)
+            finally:
+                with self._jobs_cv:
+                    self._in_flight.pop(job.path, None)
+
+    def _pydub_worker(self, job):
         """
         Decodifica file audio con PyDub.
         """
+        file_path = job.path
         try:
             log.info(f"Caricamento file: {file_path}...")
-            
+
             # Carica audio con PyDub
             audio = AudioSegment.from_wav(file_path)
+            if job.cancelled.is_set():
+                log.info(f"Caricamento annullato: {file_path}")
+                return None
 
             # Ottieni info
             sr = audio.frame_rate
             # Conversione in mono (se stereo)
             if audio.channels > 1:
                 audio = audio.set_channels(1)
-            
+
             # Conversione in array NumPy (Int16)
             samples = np.array(audio.get_array_of_samples())
 
@@ -71,29 +300,75 @@ class AudioManager(QObject):
             # audio.sample_width ti dice quanti BYTES usa (2=16bit, 3=24bit, 4=32bit)
             bytes_per_sample = audio.sample_width
             bits_per_sample = bytes_per_sample * 8
-            
+
             # Calcoliamo il divisore usando l'operatore bitwise shift
             # Esempio 16 bit: 1 << 15 = 32768
             # Esempio 24 bit: 1 << 23 = 8388608
             max_val = float(1 << (bits_per_sample - 1))
-            
+
             # Normalizzazione in Float32 (-1.0 a 1.0) per la GAN
             y = np.clip(samples.astype(np.float32) / max_val, -1.0, 1.0)
-            
-            # EMETTI IL SEGNALE
-            self._internal_data_ready.emit(y, sr)
-            
+
         except Exception as e:
             log.error(f"Errore caricamento: {e}")
+            return None
+
+        # Pre-analisi della traccia (stesso thread, priorità bassa).
+        # Un'analisi fallita non scarta la traccia: resta solo senza quel risultato
+        analysis = {}
+        for analyzer in self.analyzers:
+            if job.cancelled.is_set():
+                log.info(f"Caricamento annullato: {file_path}")
+                return None
+            try:
+                analysis.update(analyzer(y, sr))
+            except Exception as e:
+                log.error(f"Errore analisi ({getattr(analyzer, '__name__', analyzer)}): {e}")
 
-    def _finalize_loading(self, data, sr):
+        return DecodedTrack(file_path, y, sr, analysis)
+
+    def _finalize_loading(self, job, track):
         """
-        Emette evento di termine caricamento e decodifica file.
+        Riceve nel main thread la traccia decodificata: la salva in cache
+        e, se è la traccia corrente in attesa, la attiva.
         """
-        self.full_audio_data = data
-        self.sample_rate = sr
-        log.success(f"Dati Audio Pronti! Campioni: {len(data)}, SR: {sr}")
-        self.decoding_finished.emit()
+        if job.cancelled.is_set() or track.path not in self._window_paths():
+            return
+
+        self._decoded[track.path] = track
+        self._evict()
+
+        if self._waiting_for_current and track.path == self.current_path:
+            self._activate(track)
+
+    def _handle_decode_failure(self, job):
+        """Nel main thread: segna la traccia come non decodificabile e, se è la corrente, la salta."""
+        if job.cancelled.is_set() or job.path not in self._window_paths():
+            return
+
+        self._failed.add(job.path)
+        if self._waiting_for_current and job.path == self.current_path:
+            self._skip_failed_current()
+
+    def _evict(self):
+        """Libera le tracce fuori dalla finestra della playlist e rispetta il budget di memoria."""
+        window = self._window_paths()
+        for path in list(self._decoded):
+            if path not in window:
+                del self._decoded[path]
+
+        # Oltre budget: scarta le pre-decodifiche più lontane (verranno decodificate al bisogno)
+        total = sum(track.nbytes for track in self._decoded.values())
+        for path in reversed(window[1:]):
+            if total <= self.memory_budget:
+                break
+            track = self._decoded.pop(path, None)
+            if track is not None:
+                total -= track.nbytes
+                self._over_budget.add(path)
+                log.warning(f"Budget memoria superato: pre-decodifica scartata per {path}")
+
+    ### Riproduzione ###
 
     def get_current_chunk(self, window_size=1024):
         """
@@ -104,16 +379,45 @@ class AudioManager(QObject):
 
         # Posizione in millisecondi dal player
         current_ms = self.player.position()
-        
+
         # Conversione in indice array (Secondi * Campioni_al_Secondo)
         idx = int((current_ms / 1000.0) * self.sample_rate)
-        
+
         if idx + window_size > len(self.full_audio_data):
             padding = np.zeros(window_size, dtype=np.float32)
             return padding
-            
+
         return self.full_audio_data[idx : idx + window_size]
 
+    def get_beat_events(self):
+        """
+        Eventi ritmici (kick, beat, downbeat) nell'intervallo di tempo trascorso
+        dall'ultima chiamata, dalla beat grid pre-calcolata della traccia corrente.
+        Ogni evento viene restituito una sola volta, anche con frame molto lenti.
+        Ritorna None se la traccia non ha ancora un'analisi ritmica.
+        Dopo un seek (`set_position`) o un cambio traccia non vengono restituiti eventi retroattivi.
+        """
+        grid = self.current_analysis.get('beat_grid')
+        if grid is None:
+            return None
+
+        now = self.player.position() / 1000.0
+        last = self._last_event_time
+        if grid is not self._last_event_grid or last is None or now < last:
+            last = now
+        self._last_event_time, self._last_event_grid = now, grid
+
+        return {
+            'kicks': grid.kicks_between(last, now),
+            'beats': grid.beats_between(last, now),
+            'downbeats': grid.downbeats_between(last, now),
+        }
+
+    def reset_beat_events(self):
+        """Dimentica l'ultimo intervallo interrogato: la prossima chiamata non restituisce eventi."""
+        self._last_event_time = None
+        self._last_event_grid = None
+
     def play_pause(self):
         """Gestisce il toggle Play/Pausa."""
         if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
@@ -130,7 +434,25 @@ class AudioManager(QObject):
     def set_position(self, position_ms):
         """Sposta la riproduzione a un punto specifico (in millisecondi)."""
         self.player.setPosition(position_ms)
+        # Gli eventi tra la vecchia e la nuova posizione non vanno riprodotti
+        self.reset_beat_events()
 
     def get_duration(self):
         """Ritorna la durata totale in millisecondi."""
-        return self.player.duration()
\ No newline at end of file
+        return self.player.duration()
+
+
+def _estimate_decoded_bytes(path):
+    """
+    Dimensione prevista della traccia decodificata (mono float32) senza decodificarla:
+    numero di frame dall'header WAV, altrimenti dimensione del file * 4 / 2 (16 bit).
+    """
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getnframes() * 4
+    except (wave.Error, EOFError, OSError):
+        pass
+    try:
+        return os.path.getsize(path) * 2
+    except OSError:
+        return 0
@@ -0,0 +1,152 @@
+import socket
+import struct
+import time
+
+import utils.logutils as log
+
+# Protocollo: bundle OSC su UDP (letti nativamente da OSC In CHOP/DAT di TouchDesigner).
+# Ogni frame produce:
+#   /rnav/frame        ,iff  indice frame, posizione nella traccia (s), clock del publisher (s dall'avvio)
+#   /rnav/<feature>    ,f    una per feature (volume, step, low, mid, high, ...)
+#   /rnav/event/<nome> ,if   indice frame, valore (kick, target, ...)
+# Più frame possono essere raggruppati nello stesso datagramma.
+
+OSC_PREFIX = '/rnav'
+# Timetag OSC speciale "immediately": il ricevitore non deve ritardare i messaggi
+OSC_IMMEDIATELY = 1
+# Resta sotto la MTU tipica per evitare la frammentazione IP
+MAX_DATAGRAM = 1400
+
+
+def _osc_string(value):
+    data = value.encode('utf-8') + b'\x00'
+    return data + b'\x00' * (-len(data) % 4)
+
+
+def osc_message(address, *args):
+    """Codifica un messaggio OSC con argomenti int (i) e float (f)."""
+    tags = ','
+    payload = b''
+    for arg in args:
+        if isinstance(arg, int):
+            tags += 'i'
+            payload += struct.pack('>i', arg)
+        else:
+            tags += 'f'
+            payload += struct.pack('>f', float(arg))
+    return _osc_string(address) + _osc_string(tags) + payload
+
+
+def osc_bundle(messages, timetag=OSC_IMMEDIATELY):
+    data = _osc_string('#bundle') + struct.pack('>Q', timetag)
+    for message in messages:
+        data += struct.pack('>i', len(message)) + message
+    return data
+
+
+def osc_decode(data):
+    """Decodifica un pacchetto OSC (messaggio o bundle) in una lista di (address, args)."""
+    if data.startswith(b'#bundle\x00'):
+        messages, offset = [], 16
+        while offset < len(data):
+            size = struct.unpack_from('>i', data, offset)[0]
+            messages.extend(osc_decode(data[offset + 4:offset + 4 + size]))
+            offset += 4 + size
+        return messages
+
+    address, offset = _read_osc_string(data, 0)
+    tags, offset = _read_osc_string(data, offset)
+    args = []
+    for tag in tags[1:]:
+        if tag == 'i':
+            args.append(struct.unpack_from('>i', data, offset)[0])
+            offset += 4
+        elif tag == 'f':
+            args.append(struct.unpack_from('>f', data, offset)[0])
+            offset += 4
+        elif tag == 's':
+            value, offset = _read_osc_string(data, offset)
+            args.append(value)
+    return [(address, args)]
+
+
+def _read_osc_string(data, offset):
+    end = data.index(b'\x00', offset)
+    value = data[offset:end].decode('utf-8')
+    return value, end + 1 + (-(end + 1 - offset) % 4)
+
+
+class ControlPublisher:
+    """
+    Pubblica per ogni frame le feature audio e gli eventi del latent walk
+    su UDP (bundle OSC). L'invio è non bloccante: se il socket è pieno il
+    pacchetto viene scartato, il render loop non aspetta mai la rete.
+    """
+
+    def __init__(self, host='127.0.0.1', port=7000, batch_frames=1):
+        self.address = (host, port)
+        self.batch_frames = max(1, batch_frames)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+        self._pending = []
+        self._pending_size = 16
+        self._pending_frames = 0
+        # Clock relativo all'avvio: resta preciso anche in float32
+        self._t0 = time.monotonic()
+        log.info(f"Control Stream: invio OSC/UDP verso {host}:{port}")
+
+    def publish(self, frame_index, track_time_s, features, events=()):
+        """Accoda le feature del frame e invia il bundle quando il batch è completo."""
+        messages = [osc_message(f'{OSC_PREFIX}/frame', frame_index, track_time_s, time.monotonic() - self._t0)]
+        messages += [osc_message(f'{OSC_PREFIX}/{name}', value) for name, value in features.items()]
+        messages += [osc_message(f'{OSC_PREFIX}/event/{name}', frame_index, value) for name, value in events]
+
+        frame_size = sum(len(m) + 4 for m in messages)
+        if self._pending and self._pending_size + frame_size > MAX_DATAGRAM:
+            self.flush()
+
+        self._pending.extend(messages)
+        self._pending_size += frame_size
+        self._pending_frames += 1
+
+        if self._pending_frames >= self.batch_frames:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        packet = osc_bundle(self._pending)
+        self._pending, self._pending_size, self._pending_frames = [], 16, 0
+        try:
+            self.sock.sendto(packet, self.address)
+        except OSError as e:
+            # BlockingIOError incluso: pacchetto perso, si riprova al frame successivo
+            log.rate_limited('warning', 'control_stream_send', f"Control Stream: invio fallito: {e}",
+                             interval=5.0, stage='control')
+
+    def close(self):
+        self.flush()
+        self.sock.close()
+
+
+class ControlReceiver:
+    """Ricevitore locale (test e debug) dei pacchetti di `ControlPublisher`."""
+
+    def __init__(self, host='127.0.0.1', port=7000):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.port = self.sock.getsockname()[1]
+
+    def receive(self, timeout=1.0):
+        """Ritorna la lista di (address, args) del prossimo datagramma, o [] allo scadere del timeout."""
+        self.sock.settimeout(timeout)
+        try:
+            data, _ = self.sock.recvfrom(65535)
+        except socket.timeout:
+            return []
+        return osc_decode(data)
+
+    def close(self):
+        self.sock.close()
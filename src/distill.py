@@ -0,0 +1,245 @@
+"""
+Distillazione di un Generator "studente" più leggero a partire da un checkpoint esistente.
+
+Lo studente (fmap_max / fmap_inverse_coef ridotti, senza attention né SLE) viene
+addestrato a riprodurre l'uscita del teacher usando solo latenti casuali: nessun
+dataset. Il training gira su CPU a piccoli batch ed è riprendibile.
+Il risultato è un checkpoint caricabile direttamente da GANManager, più un report
+fps/qualità studente vs teacher.
+
+Esempio:
+    python src/distill.py --teacher ./resources/models/light_gan_test/model_5.pt \\
+        --output ./resources/models/light_gan_test/model_5_student.pt --steps 20000
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from gan_manager import GANManager
+from utils.lightweight_gan_cust import Generator, Noise
+
+import utils.logutils as log
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distillazione teacher -> studente del Generator")
+    parser.add_argument('--teacher', required=True, help="Checkpoint .pt del teacher")
+    parser.add_argument('--output', required=True, help="Checkpoint .pt dello studente")
+    parser.add_argument('--work-dir', default='./resources/distill', help="Stato per la ripresa del training")
+    parser.add_argument('--image-size', type=int, default=256)
+    parser.add_argument('--latent-dim', type=int, default=256)
+    parser.add_argument('--teacher-attn-res-layers', type=int, nargs='*', default=[])
+    parser.add_argument('--fmap-max', type=int, default=128)
+    parser.add_argument('--fmap-inverse-coef', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--lr', type=float, default=2e-4)
+    parser.add_argument('--save-every', type=int, default=500)
+    parser.add_argument('--eval-samples', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=None, help="torch.set_num_threads (default: tutti i core)")
+    parser.add_argument('--use-gpu', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def sample_latents(batch_size, latent_dim, device):
+    """Latenti normalizzati come nel latent walk di GANManager."""
+    z = torch.randn(batch_size, latent_dim, device=device)
+    return z / z.norm(dim=1, keepdim=True) * np.sqrt(latent_dim)
+
+
+def noise_layers(model):
+    return [m for m in model.modules() if isinstance(m, Noise)]
+
+
+def share_noise(teacher, student, batch_size, image_size, device, generator=None):
+    """
+    Stesso rumore per teacher e studente (i layer Noise hanno le stesse
+    risoluzioni spaziali): il target diventa deterministico dato il latente.
+    """
+    t_layers, s_layers = noise_layers(teacher), noise_layers(student)
+    sizes = [2 ** (res + 1) for res in teacher.res_layers]
+    for t_layer, s_layer, size in zip(t_layers, s_layers, sizes):
+        noise = torch.randn(batch_size, 1, size, size, device=device, generator=generator)
+        t_layer.noise_buffer = noise
+        s_layer.noise_buffer = noise
+
+
+def clear_noise(*models):
+    for model in models:
+        for layer in noise_layers(model):
+            layer.noise_buffer = None
+
+
+def distill_loss(student_out, teacher_out):
+    """L1 multi-scala: dettagli fini + struttura globale."""
+    loss = F.l1_loss(student_out, teacher_out)
+    for factor in (2, 4):
+        loss = loss + F.l1_loss(F.avg_pool2d(student_out, factor), F.avg_pool2d(teacher_out, factor))
+    return loss
+
+
+def measure_fps(model, latent_dim, device, iterations=30, warmup=5):
+    z = sample_latents(1, latent_dim, device)
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(z)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            model(z)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+    return iterations / (time.perf_counter() - start)
+
+
+def evaluate(teacher, student, args, device):
+    """Qualità su un insieme fisso di latenti (L1 e PSNR in [0, 1]) e fps a batch 1."""
+    generator = torch.Generator(device=device).manual_seed(args.seed + 1)
+    z = torch.randn(args.eval_samples, args.latent_dim, device=device, generator=generator)
+    z = z / z.norm(dim=1, keepdim=True) * np.sqrt(args.latent_dim)
+
+    student.eval()
+    share_noise(teacher, student, args.eval_samples, args.image_size, device, generator)
+    with torch.no_grad():
+        t_img = (teacher(z).clamp(-1, 1) + 1) / 2
+        s_img = (student(z).clamp(-1, 1) + 1) / 2
+    clear_noise(teacher, student)
+
+    mse = F.mse_loss(s_img, t_img, reduction='none').flatten(1).mean(dim=1)
+    psnr = (10 * torch.log10(1.0 / mse.clamp_min(1e-10))).mean().item()
+
+    teacher_fps = measure_fps(teacher, args.latent_dim, device)
+    student_fps = measure_fps(student, args.latent_dim, device)
+
+    return {
+        'l1': F.l1_loss(s_img, t_img).item(),
+        'psnr_db': psnr,
+        'teacher_fps': teacher_fps,
+        'student_fps': student_fps,
+        'speedup': student_fps / teacher_fps,
+        'teacher_params': sum(p.numel() for p in teacher.parameters()),
+        'student_params': sum(p.numel() for p in student.parameters()),
+    }
+
+
+def save_student(student, config, args, step):
+    """Formato compatibile con GANManager: pesi 'GE.*' sotto 'GAN' + configurazione dell'architettura."""
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    torch.save({
+        'GAN': {f'GE.{k}': v.cpu() for k, v in student.state_dict().items()},
+        'generator_config': config,
+        # Distillato e valutato in eval (BatchNorm con running stats): GANManager lo carica così
+        'eval_mode': True,
+        'distilled_from': os.path.abspath(args.teacher),
+        'steps': step,
+    }, args.output)
+
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    # Teacher caricato con la stessa logica dell'applicazione
+    gan = GANManager(
+        model_path=args.teacher,
+        image_size=args.image_size,
+        latent_dim=args.latent_dim,
+        use_gpu=args.use_gpu,
+        eval_mode=True,
+        attn_res_layers=args.teacher_attn_res_layers
+    )
+    teacher, device = gan.model, gan.device
+    for p in teacher.parameters():
+        p.requires_grad_(False)
+
+    config = {
+        'image_size': args.image_size,
+        'latent_dim': args.latent_dim,
+        'fmap_max': args.fmap_max,
+        'fmap_inverse_coef': args.fmap_inverse_coef,
+        'attn_res_layers': [],
+        'use_sle': False,
+    }
+    student = Generator(**config).to(device)
+    optimizer = torch.optim.Adam(student.parameters(), lr=args.lr, betas=(0.5, 0.9))
+
+    # Ripresa del training
+    os.makedirs(args.work_dir, exist_ok=True)
+    state_path = os.path.join(args.work_dir, 'distill_state.pt')
+    step = 0
+    if os.path.exists(state_path):
+        state = torch.load(state_path, map_location=device, weights_only=False)
+        if state['config'] == config:
+            student.load_state_dict(state['student'])
+            optimizer.load_state_dict(state['optimizer'])
+            torch.set_rng_state(state['rng'].cpu())
+            step = state['step']
+            log.info(f"Distillazione: ripresa dallo step {step}")
+        else:
+            log.warning("Distillazione: stato salvato con un'architettura diversa, ripartenza da zero.")
+
+    def save_state():
+        torch.save({
+            'student': student.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'rng': torch.get_rng_state(),
+            'step': step,
+            'config': config,
+        }, state_path)
+        save_student(student, config, args, step)
+
+    log.info(f"Distillazione: studente {config} su {device}, batch {args.batch_size}")
+    student.train()
+    running, last_log = [], time.perf_counter()
+    try:
+        while step < args.steps:
+            z = sample_latents(args.batch_size, args.latent_dim, device)
+            share_noise(teacher, student, args.batch_size, args.image_size, device)
+
+            with torch.no_grad():
+                target = teacher(z)
+
+            loss = distill_loss(student(z), target)
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            optimizer.step()
+
+            step += 1
+            running.append(loss.item())
+
+            if time.perf_counter() - last_log > 10.0:
+                log.info(f"Distillazione: step {step}/{args.steps} loss {np.mean(running):.4f}", stage='distill')
+                running, last_log = [], time.perf_counter()
+
+            if step % args.save_every == 0:
+                save_state()
+    except KeyboardInterrupt:
+        log.warning(f"Distillazione interrotta allo step {step}, salvataggio dello stato...")
+    finally:
+        clear_noise(teacher, student)
+        save_state()
+
+    report = evaluate(teacher, student, args, device)
+    report.update({'steps': step, 'config': config, 'teacher': os.path.abspath(args.teacher)})
+    report_path = os.path.splitext(args.output)[0] + '.report.json'
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    log.success(f"Studente salvato in {args.output} ({report['student_params']:,} parametri, "
+                f"teacher {report['teacher_params']:,})")
+    log.success(f"fps teacher {report['teacher_fps']:.1f} -> studente {report['student_fps']:.1f} "
+                f"(x{report['speedup']:.2f}), PSNR {report['psnr_db']:.2f} dB, L1 {report['l1']:.4f}")
+    log.info(f"Report salvato in {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import asyncio
+import base64
+import hashlib
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from torchvision.io import encode_jpeg
+
+import utils.logutils as log
+
+# Header dei frame raw (WebSocket e TCP): magic, numero frame, larghezza, altezza, canali
+RAW_HEADER = struct.Struct('<4sIHHH')
+RAW_MAGIC = b'RNAV'
+
+MJPEG_BOUNDARY = b'frame'
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+INDEX_PAGE = b"""<!DOCTYPE html>
+<html><head><title>GAN Visualizer</title></head>
+<body style="margin:0;background:#000;display:flex;justify-content:center;align-items:center;height:100vh">
+<img src="/stream.mjpg" style="height:100%;image-rendering:auto">
+</body></html>"""
+
+
+class FrameBroadcaster:
+    """
+    Server asyncio (in un thread dedicato con il suo event loop) che trasmette
+    i frame generati ai client in rete:
+    - HTTP  `/stream.mjpg` -> MJPEG (multipart/x-mixed-replace)
+    - HTTP  `/ws`          -> WebSocket con frame raw RGB
+    - TCP   (porta separata, opzionale) -> frame raw RGB con header `RAW_HEADER`
+
+    Ogni frame viene codificato una sola volta per formato e condiviso tra tutti
+    i client. Un client lento salta i frame intermedi (riceve sempre l'ultimo)
+    invece di accumulare una coda o rallentare il render loop.
+    """
+
+    def __init__(self, host='0.0.0.0', http_port=8080, tcp_port=None, jpeg_quality=85):
+        self.host = host
+        self.http_port = http_port
+        self.tcp_port = tcp_port
+        self.jpeg_quality = jpeg_quality
+
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._stop_event = None
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='frame-encoder')
+
+        # Stato condiviso (modificato solo dal thread dell'event loop)
+        self._frame = None
+        self._seq = 0
+        self._frame_event = None
+        self._encoded = {}
+        self._clients = 0
+        self._stream_tasks = set()
+        # Task degli handler di connessione: da Python 3.12 wait_closed() attende anche loro
+        self._handler_tasks = set()
+
+    ### Ciclo di vita ###
+
+    def start(self):
+        """Avvia il server in background e attende che le porte siano in ascolto."""
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run, name='frame-broadcaster', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        """Chiude il server e tutte le connessioni."""
+        if self._thread is None:
+            return
+
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        self._executor.shutdown(wait=False)
+
+    @property
+    def client_count(self):
+        return self._clients
+
+    def publish(self, frame: np.ndarray):
+        """
+        Pubblica un nuovo frame (H, W, C) uint8. Chiamabile da qualsiasi thread.
+        Non copia né codifica nulla nel thread chiamante: l'array non deve
+        essere modificato dopo la chiamata.
+        """
+        if self._loop is None or self._clients == 0 or frame is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._set_frame, frame)
+
+    ### Event loop ###
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            log.error(f"Frame Broadcaster: errore del server: {e}")
+        finally:
+            self._ready.set()
+            self._loop.close()
+            self._loop = None
+
+    async def _serve(self):
+        self._stop_event = asyncio.Event()
+        self._frame_event = asyncio.Event()
+
+        servers = []
+        if self.http_port is not None:
+            http_server = await asyncio.start_server(self._handle_http, self.host, self.http_port)
+            self.http_port = http_server.sockets[0].getsockname()[1]
+            servers.append(http_server)
+            log.info(f"Frame Broadcaster: HTTP/MJPEG/WebSocket in ascolto su {self.host}:{self.http_port}")
+
+        if self.tcp_port is not None:
+            tcp_server = await asyncio.start_server(self._handle_tcp, self.host, self.tcp_port)
+            self.tcp_port = tcp_server.sockets[0].getsockname()[1]
+            servers.append(tcp_server)
+            log.info(f"Frame Broadcaster: TCP raw in ascolto su {self.host}:{self.tcp_port}")
+
+        self._ready.set()
+        await self._stop_event.wait()
+
+        for server in servers:
+            server.close()
+        # Gli handler restano bloccati in lettura sul client: vanno annullati insieme agli stream
+        tasks = self._stream_tasks | self._handler_tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for server in servers:
+            await server.wait_closed()
+
+    def _set_frame(self, frame):
+        self._frame = frame
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        self._encoded.clear()
+
+        # Sveglia tutti i client in attesa e prepara l'evento per il frame successivo
+        event, self._frame_event = self._frame_event, asyncio.Event()
+        event.set()
+
+    async def _next_payload(self, fmt, last_seq):
+        """Attende un frame più recente di `last_seq` e ne restituisce la codifica condivisa."""
+        while self._seq == last_seq or self._frame is None:
+            await self._frame_event.wait()
+
+        seq, frame = self._seq, self._frame
+        cached = self._encoded.get(fmt)
+        if cached is None or cached[0] != seq:
+            encoder = self._encode_jpeg if fmt == 'jpeg' else self._encode_raw
+            future = self._loop.run_in_executor(self._executor, encoder, frame, seq)
+            cached = (seq, future)
+            self._encoded[fmt] = cached
+
+        # shield: se un client si disconnette, la codifica resta valida per gli altri
+        return seq, await asyncio.shield(cached[1])
+
+    def _encode_jpeg(self, frame, seq):
+        tensor = torch.from_numpy(np.ascontiguousarray(frame)).permute(2, 0, 1).contiguous()
+        jpeg = encode_jpeg(tensor, quality=self.jpeg_quality).numpy().tobytes()
+        part_header = (
+            b'--' + MJPEG_BOUNDARY + b'\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n'
+        )
+        return part_header + jpeg + b'\r\n'
+
+    def _encode_raw(self, frame, seq):
+        height, width, channels = frame.shape
+        return RAW_HEADER.pack(RAW_MAGIC, seq, width, height, channels) + np.ascontiguousarray(frame).tobytes()
+
+    def _start_stream(self, writer, fmt, frame_prefix=None):
+        task = asyncio.ensure_future(self._stream(writer, fmt, frame_prefix))
+        self._stream_tasks.add(task)
+        task.add_done_callback(self._stream_tasks.discard)
+        return task
+
+    async def _stream(self, writer, fmt, frame_prefix=None):
+        """Invia l'ultimo frame disponibile finché il client resta connesso."""
+        self._clients += 1
+        last_seq = self._seq
+        try:
+            while not writer.is_closing():
+                last_seq, payload = await self._next_payload(fmt, last_seq)
+                if frame_prefix is not None:
+                    writer.write(frame_prefix(len(payload)))
+                writer.write(payload)
+                # drain() blocca solo questo client: nel frattempo i frame nuovi
+                # sovrascrivono il precedente e il client salta direttamente all'ultimo
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients -= 1
+
+    def _track_handler(self):
+        task = asyncio.current_task()
+        self._handler_tasks.add(task)
+        task.add_done_callback(self._handler_tasks.discard)
+
+    ### Protocolli ###
+
+    async def _handle_http(self, reader, writer):
+        self._track_handler()
+        peer = writer.get_extra_info('peername')
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            lines = request.decode('latin-1').split('\r\n')
+            method, path, _ = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+
+            if method != 'GET':
+                await self._send_response(writer, b'405 Method Not Allowed', b'text/plain', b'')
+            elif path == '/':
+                await self._send_response(writer, b'200 OK', b'text/html', INDEX_PAGE)
+            elif path == '/stream.mjpg':
+                log.info(f"Frame Broadcaster: client MJPEG connesso {peer}")
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\n'
+                    b'Content-Type: multipart/x-mixed-replace; boundary=' + MJPEG_BOUNDARY + b'\r\n'
+                    b'Cache-Control: no-cache\r\n'
+                    b'Connection: close\r\n\r\n'
+                )
+                await self._start_stream(writer, 'jpeg')
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self._handle_websocket(reader, writer, headers, peer)
+            else:
+                await self._send_response(writer, b'404 Not Found', b'text/plain', b'Not Found')
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_response(self, writer, status, content_type, body):
+        writer.write(
+            b'HTTP/1.1 ' + status + b'\r\n'
+            b'Content-Type: ' + content_type + b'\r\n'
+            b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+            b'Connection: close\r\n\r\n' + body
+        )
+        await writer.drain()
+
+    async def _handle_websocket(self, reader, writer, headers, peer):
+        key = headers.get('sec-websocket-key')
+        if key is None:
+            await self._send_response(writer, b'400 Bad Request', b'text/plain', b'')
+            return
+
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest())
+        writer.write(
+            b'HTTP/1.1 101 Switching Protocols\r\n'
+            b'Upgrade: websocket\r\n'
+            b'Connection: Upgrade\r\n'
+            b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n'
+        )
+        await writer.drain()
+        log.info(f"Frame Broadcaster: client WebSocket connesso {peer}")
+
+        # I messaggi in arrivo dal client vengono ignorati: serve solo rilevare la chiusura
+        stream_task = self._start_stream(writer, 'raw', frame_prefix=_ws_binary_header)
+        try:
+            while not stream_task.done():
+                header = await reader.readexactly(2)
+                opcode = header[0] & 0x0F
+                length = header[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack('!H', await reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', await reader.readexactly(8))[0]
+                mask_len = 4 if header[1] & 0x80 else 0
+                await reader.readexactly(mask_len + length)
+                if opcode == 0x8:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            stream_task.cancel()
+
+    async def _handle_tcp(self, reader, writer):
+        self._track_handler()
+        log.info(f"Frame Broadcaster: client TCP connesso {writer.get_extra_info('peername')}")
+        stream_task = self._start_stream(writer, 'raw')
+        try:
+            # Il protocollo TCP è solo in uscita: una lettura vuota indica la disconnessione
+            while not stream_task.done() and await reader.read(4096):
+                pass
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            stream_task.cancel()
+            writer.close()
+
+
+def _ws_binary_header(length):
+    """Header di un frame WebSocket binario (FIN + opcode 0x2), senza maschera."""
+    if length < 126:
+        return struct.pack('!BB', 0x82, length)
+    if length < (1 << 16):
+        return struct.pack('!BBH', 0x82, 126, length)
+    return struct.pack('!BBQ', 0x82, 127, length)
@@ -1,16 +1,23 @@
 import os
 import torch
 import numpy as np
-from utils.lightweight_gan_cust import Generator
+from utils.lightweight_gan_cust import Generator, set_memory_efficient_attention
+from utils.static_runner import StaticGeneratorRunner
+from utils.audio_features import rms
 import utils.logutils as log
 
 
 class GANManager:
     # Aggiungiamo il parametro use_gpu=True come default
-    def __init__(self, model_path, image_size=256, latent_dim=256, use_gpu=True, eval_mode=True):
+    def __init__(self, model_path, image_size=256, latent_dim=256, use_gpu=True, eval_mode=True,
+                 static_inference=False, noise_bank_size=64, post_fx=None,
+                 attn_res_layers=(), memory_efficient_attn=True):
         self.model_path = model_path
         self.image_size = image_size
         self.latent_dim = latent_dim
+        # Risoluzioni con LinearAttention (devono coincidere con quelle usate in training)
+        self.attn_res_layers = list(attn_res_layers)
+        self.memory_efficient_attn = memory_efficient_attn
         
         # LOGICA DI SELEZIONE DEVICE
         # Usa CUDA solo se l'utente lo vuole E se è disponibile
@@ -27,11 +34,24 @@ class GANManager:
         # Carica il modello
         self.model = self._load_model(eval_mode=eval_mode)
 
+        # Runner a memoria statica: buffer pre-allocati e rumore pre-generato (batch=1)
+        self.runner = None
+        self.noise_bank_size = noise_bank_size
+        if static_inference:
+            self.runner = StaticGeneratorRunner(self.model, batch_size=1, noise_bank_size=noise_bank_size)
+
+        # Catena di post-processing opzionale (PostFXChain) eseguita sul device prima del .cpu()
+        self.post_fx = post_fx
+
         # Posizione attuale nello spazio (da dove generiamo l'immagine)
         self.current_z = torch.randn(1, self.latent_dim).to(self.device)
         # Posizione obiettivo verso cui ci stiamo muovendo
         self.target_z = torch.randn(1, self.latent_dim).to(self.device)
 
+        # Feature ed eventi dell'ultimo frame (letti dal control stream)
+        self.last_features = {}
+        self.last_events = []
+
     def _load_model(self, eval_mode=True):
         # ... (Il resto del codice rimane uguale, userà self.device automaticamente) ...
         # Copia pure il metodo _load_model e generate_image dal messaggio precedente
@@ -40,7 +60,9 @@ class GANManager:
         
         model = Generator(
             image_size=self.image_size, 
-            latent_dim=self.latent_dim
+            latent_dim=self.latent_dim,
+            attn_res_layers=self.attn_res_layers,
+            memory_efficient_attn=self.memory_efficient_attn
         )
 
         if not os.path.exists(self.model_path):
@@ -51,6 +73,25 @@ class GANManager:
             checkpoint = torch.load(self.model_path, map_location=self.device, weights_only=False)
             gan_weights = checkpoint['GAN']
 
+            # Checkpoint distillati (distill.py): architettura del Generator salvata con i pesi
+            if 'generator_config' in checkpoint:
+                config = dict(checkpoint['generator_config'])
+                self.image_size = config.pop('image_size', self.image_size)
+                self.latent_dim = config.pop('latent_dim', self.latent_dim)
+                model = Generator(
+                    image_size=self.image_size,
+                    latent_dim=self.latent_dim,
+                    memory_efficient_attn=self.memory_efficient_attn,
+                    **config
+                )
+                log.info(f"Configurazione Generator dal checkpoint: {checkpoint['generator_config']}")
+
+                # Lo studente è distillato e valutato con le statistiche di BatchNorm salvate:
+                # in train mode (batch 1) produrrebbe immagini diverse da quelle distillate
+                if checkpoint.get('eval_mode') and not eval_mode:
+                    log.warning("Checkpoint distillato: eval mode forzata (EVAL_MODE ignorato).")
+                    eval_mode = True
+
             gen_weights = {}
             found_ema = False
             
@@ -82,14 +123,32 @@ class GANManager:
             log.error(f"❌ Errore critico nel caricamento: {e}")
             return model
 
-    def generate_image(self, audio_chunk) -> np.uint8:
+    def set_memory_efficient_attention(self, enabled=True):
+        """Cambia a caldo l'implementazione della LinearAttention locale del modello caricato."""
+        if self.model is None or enabled == self.memory_efficient_attn:
+            return
+        self.memory_efficient_attn = enabled
+        set_memory_efficient_attention(self.model, enabled)
+
+        # Il CUDA Graph registra i kernel del forward: va ricatturato con la nuova attention
+        if self.runner is not None and self.runner.graph is not None:
+            self.runner.release()
+            self.runner = StaticGeneratorRunner(self.model, batch_size=1, noise_bank_size=self.noise_bank_size)
+        log.info(f"GAN Manager: attention memory-efficient {'attivata' if enabled else 'disattivata'}")
+
+    def generate_image(self, audio_chunk, beat_events=None) -> np.uint8:
+        """
+        Genera il frame corrente. `beat_events` (da AudioManager.get_beat_events) contiene
+        i kick/beat/downbeat pre-calcolati caduti nell'intervallo del frame: se assente
+        si usa la soglia sul volume del chunk.
+        """
         if self.model is None or len(audio_chunk) == 0:
             return None
 
         with torch.no_grad():
             # 1. FEATURE EXTRACTION DALL'AUDIO
             # Calcoliamo il volume medio del chunk
-            volume = np.linalg.norm(audio_chunk) / np.sqrt(len(audio_chunk))
+            volume = rms(audio_chunk)
             
             # 2. LOGICA DI NAVIGAZIONE (LATENT WALK)
             # La velocità di movimento dipende dal volume.
@@ -105,27 +164,50 @@ class GANManager:
             # 3. GESTIONE TARGET (Cambio di direzione)
             # Se siamo arrivati vicini al target, ne scegliamo uno nuovo a caso
             distance_to_target = torch.norm(self.target_z - self.current_z)
-            if distance_to_target < 0.2:
+            events = []
+            # Con la beat grid i cambi di direzione cadono sui downbeat (battuta)
+            on_downbeat = beat_events is not None and beat_events['downbeats'] > 0
+            if distance_to_target < 0.2 or on_downbeat:
                 self.target_z = torch.randn(1, self.latent_dim).to(self.device)
+                events.append(('target', 1.0))
+            if beat_events is not None and beat_events['beats'] > 0:
+                events.append(('beat', 1.0))
 
             # 4. GESTIONE IMPULSI (Opzionale per effetto "Kick/Cassa")
             # Se c'è un forte picco audio, aggiungiamo un rumore istantaneo
             # che deforma l'immagine sul colpo di batteria
-            if volume > 0.5:
+            if beat_events is not None:
+                # Ogni kick dell'intervallo viene applicato una sola volta, a qualunque framerate
+                for strength in beat_events['kicks']:
+                    kick_impact = torch.randn(1, self.latent_dim).to(self.device) * float(strength) * 0.2
+                    self.current_z += kick_impact
+                    events.append(('kick', float(strength)))
+            elif volume > 0.5:
                 kick_impact = torch.randn(1, self.latent_dim).to(self.device) * volume * 0.2
                 self.current_z += kick_impact
+                events.append(('kick', float(volume)))
+
+            self.last_features = {'volume': float(volume), 'step': float(step)}
+            self.last_events = events
 
             # Normalizzazione (Best practice per non far degradare l'immagine delle GAN nel tempo)
             self.current_z = self.current_z / self.current_z.norm() * np.sqrt(self.latent_dim)
 
             # 5. GENERAZIONE DELL'IMMAGINE
-            generated_tensor = self.model(self.current_z)
+            if self.runner is not None:
+                generated_tensor = self.runner(self.current_z)
+            else:
+                generated_tensor = self.model(self.current_z)
 
             # --- Formattazione Output (Rimane identica) ---
             if torch.isnan(generated_tensor).any():
                 generated_tensor = torch.nan_to_num(generated_tensor, nan=0.0)
 
-            img_data = (generated_tensor.clamp(-1, 1) + 1) / 2
+            # 6. POST-PROCESSING SUL DEVICE (upscale, feedback, grading)
+            if self.post_fx is not None:
+                img_data = self.post_fx(generated_tensor)
+            else:
+                img_data = (generated_tensor.clamp(-1, 1) + 1) / 2
             img_data = (img_data * 255).byte()
             final_image = img_data[0].permute(1, 2, 0).cpu().numpy()
             
@@ -0,0 +1,167 @@
+import ctypes
+
+import numpy as np
+from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtOpenGLWidgets import QOpenGLWidget
+import OpenGL.GL as GL
+from OpenGL.error import GLError
+
+import utils.logutils as log
+
+
+class GLPreview(QOpenGLWidget):
+    """
+    Anteprima OpenGL con una texture persistente.
+    - Ad ogni frame i pixel vengono caricati con `glTexSubImage2D` (nessuna
+      nuova allocazione), passando da una coppia di Pixel Buffer Object.
+    - Lo scaling alla dimensione della finestra avviene nel rasterizzatore GL
+      (filtro lineare), mantenendo le proporzioni.
+    - Se il contesto GL non è utilizzabile emette `gl_failed` e la GUI torna a QLabel.
+    """
+    gl_failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, use_pbo=True):
+        super().__init__(parent)
+        self.use_pbo = use_pbo
+
+        self._texture = None
+        self._tex_shape = None
+        self._pbos = []
+        self._pbo_index = 0
+        self._pending = None
+        self._has_frame = False
+        self.failed = False
+
+    ### API ###
+
+    def set_image(self, img_array: np.ndarray):
+        """Memorizza il frame e richiede un repaint: l'upload avviene in `paintGL`."""
+        if img_array is None or self.failed:
+            return
+        self._pending = img_array
+        self.update()
+
+    ### Callback OpenGL ###
+
+    def initializeGL(self):
+        try:
+            context = self.context()
+            if context is None or not context.isValid():
+                raise RuntimeError("contesto OpenGL non valido")
+            # Texture e PBO vanno liberati finché il contesto esiste ancora
+            context.aboutToBeDestroyed.connect(self.cleanup)
+
+            GL.glClearColor(0.0, 0.0, 0.0, 1.0)
+            self._texture = GL.glGenTextures(1)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+            if self.use_pbo:
+                try:
+                    self._pbos = list(np.atleast_1d(GL.glGenBuffers(2)))
+                except GLError:
+                    log.warning("GL Preview: PBO non supportati, upload diretto della texture.")
+                    self._pbos = []
+
+            log.info("GL Preview: anteprima OpenGL attiva.")
+        except Exception as e:
+            self._fail(e)
+
+    def paintGL(self):
+        if self.failed:
+            return
+        try:
+            GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+
+            if self._pending is not None:
+                self._upload(self._pending)
+                self._pending = None
+
+            if self._has_frame:
+                self._draw()
+        except Exception as e:
+            self._fail(e)
+
+    ### Interni ###
+
+    def _fail(self, error):
+        self.failed = True
+        log.warning(f"GL Preview: OpenGL non disponibile ({error}), fallback su QLabel.")
+        self.gl_failed.emit(str(error))
+
+    def _upload(self, img):
+        img = np.ascontiguousarray(img)
+        height, width, channels = img.shape
+        fmt = GL.GL_RGBA if channels == 4 else GL.GL_RGB
+        size = img.nbytes
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+
+        # Allocazione della texture solo al primo frame o se cambia la dimensione
+        if self._tex_shape != img.shape:
+            internal = GL.GL_RGBA8 if channels == 4 else GL.GL_RGB8
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, internal, width, height, 0, fmt, GL.GL_UNSIGNED_BYTE, None)
+            self._tex_shape = img.shape
+
+        if self._pbos:
+            pbo = self._pbos[self._pbo_index]
+            self._pbo_index = (self._pbo_index + 1) % len(self._pbos)
+
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, pbo)
+            # Orphaning: il driver non deve attendere il trasferimento precedente
+            GL.glBufferData(GL.GL_PIXEL_UNPACK_BUFFER, size, None, GL.GL_STREAM_DRAW)
+            GL.glBufferSubData(GL.GL_PIXEL_UNPACK_BUFFER, 0, size, img)
+            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height, fmt, GL.GL_UNSIGNED_BYTE,
+                               ctypes.c_void_p(0))
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+        else:
+            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height, fmt, GL.GL_UNSIGNED_BYTE, img)
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        self._has_frame = True
+
+    def _draw(self):
+        height, width, _ = self._tex_shape
+        ratio = self.devicePixelRatio()
+        view_w, view_h = int(self.width() * ratio), int(self.height() * ratio)
+
+        # Letterbox: adatta l'immagine alla finestra mantenendo le proporzioni
+        scale = min(view_w / width, view_h / height)
+        draw_w, draw_h = int(width * scale), int(height * scale)
+        GL.glViewport((view_w - draw_w) // 2, (view_h - draw_h) // 2, draw_w, draw_h)
+
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texture)
+        GL.glBegin(GL.GL_QUADS)
+        # La riga 0 dell'immagine è in alto: coordinate v invertite
+        GL.glTexCoord2f(0.0, 1.0); GL.glVertex2f(-1.0, -1.0)
+        GL.glTexCoord2f(1.0, 1.0); GL.glVertex2f(1.0, -1.0)
+        GL.glTexCoord2f(1.0, 0.0); GL.glVertex2f(1.0, 1.0)
+        GL.glTexCoord2f(0.0, 0.0); GL.glVertex2f(-1.0, 1.0)
+        GL.glEnd()
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glDisable(GL.GL_TEXTURE_2D)
+
+    def cleanup(self):
+        """
+        Libera texture e PBO. Chiamato alla distruzione del contesto e prima di
+        rimuovere il widget (fallback su QLabel, chiusura della finestra).
+        """
+        if self._texture is None or self.context() is None:
+            return
+        self.makeCurrent()
+        try:
+            GL.glDeleteTextures(1, [self._texture])
+            if self._pbos:
+                GL.glDeleteBuffers(len(self._pbos), self._pbos)
+        except GLError as e:
+            log.warning(f"GL Preview: errore nel rilascio delle risorse: {e}")
+        finally:
+            self.doneCurrent()
+            self._texture = None
+            self._pbos = []
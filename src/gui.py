@@ -6,10 +6,20 @@ from PyQt6.QtMultimedia import QMediaPlayer
 from PyQt6.QtGui import QImage, QPixmap
 import numpy as np
 
+import utils.logutils as log
+
+# Anteprima OpenGL opzionale: se PyOpenGL/QtOpenGLWidgets mancano si usa QLabel
+try:
+    from gl_preview import GLPreview
+except ImportError:
+    GLPreview = None
+
 class GUI(QWidget):
-    def __init__(self, audio_manager, img_size=256):
+    def __init__(self, audio_manager, img_size=256, use_gl=True):
         super().__init__()
         self.audio = audio_manager
+        self.use_gl = use_gl and GLPreview is not None
+        self.gl_preview = None
         
         # Flag per evitare conflitti quando l'utente trascina lo slider
         self.user_is_seeking = False 
@@ -40,7 +50,15 @@ class GUI(QWidget):
         self.lbl_image = QLabel("In attesa dell'audio...")
         self.lbl_image.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.lbl_image.setMinimumSize(img_size, img_size)
-        layout.addWidget(self.lbl_image)
+
+        # Anteprima: texture OpenGL persistente scalata dalla GPU, QLabel come fallback
+        if self.use_gl:
+            self.gl_preview = GLPreview(self)
+            self.gl_preview.setMinimumSize(img_size, img_size)
+            self.gl_preview.gl_failed.connect(self.fallback_to_label)
+            self.lbl_image.hide()
+            layout.addWidget(self.gl_preview, stretch=1)
+        layout.addWidget(self.lbl_image, stretch=1)
 
         # Slider di avanzamento
         self.slider = QSlider(Qt.Orientation.Horizontal)
@@ -91,12 +109,21 @@ class GUI(QWidget):
         self.audio.player.durationChanged.connect(self.update_duration)
         self.audio.player.mediaStatusChanged.connect(self.handle_media_status)
 
+        # Eventi dall'AudioManager (decodifica e playlist)
+        self.audio.decoding_finished.connect(self.on_decoding_complete)
+        self.audio.track_changed.connect(self.on_track_changed)
+        self.audio.decoding_failed.connect(self.on_decoding_failed)
+
     ### Logica GUI ###
 
     def set_image(self, img_array: np.ndarray):
         if img_array is None:
             return
-        
+
+        if self.gl_preview is not None:
+            self.gl_preview.set_image(img_array)
+            return
+
         # Il gan_manager restituisce un'immagine con forma (H, W, 3) e tipo uint8
         height, width, channels = img_array.shape
         bytes_per_line = channels * width
@@ -107,27 +134,53 @@ class GUI(QWidget):
         # Applichiamo l'immagine alla Label
         self.lbl_image.setPixmap(QPixmap.fromImage(q_img))
 
+    def fallback_to_label(self, reason=""):
+        """Sostituisce l'anteprima OpenGL con il QLabel se GL non è disponibile."""
+        if self.gl_preview is None:
+            return
+        log.warning(f"GUI: anteprima OpenGL disattivata, uso QLabel. {reason}")
+        self.gl_preview.cleanup()
+        self.gl_preview.hide()
+        self.gl_preview.deleteLater()
+        self.gl_preview = None
+        self.lbl_image.show()
+
+    def closeEvent(self, event):
+        # Rilascia texture e PBO dell'anteprima mentre il contesto OpenGL è ancora valido
+        if self.gl_preview is not None:
+            self.gl_preview.cleanup()
+        super().closeEvent(event)
+
     def open_file_dialog(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Apri Audio", "", "Audio (*.mp3 *.wav *.ogg *.flac)")
-        if file_path:
+        # Più file selezionati = playlist (le tracce successive vengono pre-decodificate)
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Apri Audio", "", "Audio (*.mp3 *.wav *.ogg *.flac)")
+        if file_paths:
             self.btn_play.setEnabled(False)
             self.btn_stop.setEnabled(False)
             self.slider.setEnabled(False)
-            self.lbl_title.setText(f"Decodifica in corso: {os.path.basename(file_path)}...")
-
-            try:
-                self.audio.decoding_finished.disconnect()
-            except TypeError:
-                pass
+            self.lbl_title.setText(f"Decodifica in corso: {os.path.basename(file_paths[0])}...")
 
-            self.audio.decoding_finished.connect(lambda: self.on_decoding_complete(file_path))
-            self.audio.load_file(file_path)
+            self.audio.set_playlist(file_paths)
 
-    def on_decoding_complete(self, file_path):
+    def on_decoding_complete(self):
         """Slot chiamato quando l'AudioManager ha finito di processare il file."""
-        self.lbl_title.setText(os.path.basename(file_path))
         self.start_audio()
 
+    def on_decoding_failed(self, file_path):
+        """Slot chiamato quando nessuna traccia rimanente della playlist è decodificabile."""
+        self.btn_play.setEnabled(False)
+        self.btn_stop.setEnabled(False)
+        self.slider.setEnabled(False)
+        self.slider.setValue(0)
+        self.btn_play.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay))
+        self.lbl_title.setText(f"Errore caricamento: {os.path.basename(file_path)}")
+
+    def on_track_changed(self, file_path):
+        """Slot chiamato ad ogni cambio traccia della playlist."""
+        position = f" ({self.audio.current_index + 1}/{len(self.audio.playlist)})" if len(self.audio.playlist) > 1 else ""
+        self.lbl_title.setText(os.path.basename(file_path) + position)
+        self.btn_play.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPause))
+
     def start_audio(self):
         self.btn_play.setEnabled(True)
         self.btn_stop.setEnabled(True)
@@ -180,4 +233,6 @@ class GUI(QWidget):
 
     def handle_media_status(self, status):
         if status == QMediaPlayer.MediaStatus.EndOfMedia:
-            self.stop_audio()
\ No newline at end of file
+            # Fine traccia: passa alla successiva della playlist, altrimenti stop
+            if not self.audio.advance():
+                self.stop_audio()
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+Harness headless per misurare la latenza audio -> visual end-to-end.
+
+Riproduce un audio sintetico con impulsi a tempi noti attraverso il percorso
+AudioManager -> GANManager -> sink, con clock simulato o reale, rileva il frame
+in cui il visual reagisce (passo nel latente o energia della differenza tra frame)
+e riporta la distribuzione delle latenze per ogni configurazione.
+
+Esempio:
+    python src/latency_harness.py --model ./resources/models/light_gan_test/model_5.pt --fps 30 60 --window 1024 2048
+"""
+import sys
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+import torch
+from PyQt6.QtCore import QCoreApplication
+
+from audio_manager import AudioManager
+from gan_manager import GANManager
+from utils.beat_analysis import analyze_track
+
+import utils.logutils as log
+
+
+class SimulatedPlayer:
+    """
+    Sostituto di QMediaPlayer per l'harness: la posizione viene aggiornata
+    solo ogni `granularity_ms`, come accade con `player.position()`.
+    """
+    def __init__(self, granularity_ms=10):
+        self.granularity_ms = granularity_ms
+        self.clock_ms = 0.0
+
+    def position(self):
+        if self.granularity_ms <= 0:
+            return int(self.clock_ms)
+        return int(self.clock_ms // self.granularity_ms * self.granularity_ms)
+
+
+def synth_impulse_track(duration_s=20.0, sample_rate=44100, interval_s=0.5, jitter_s=0.13,
+                        noise_level=0.01, seed=0):
+    """
+    Silenzio con rumore di fondo e colpi tipo "cassa" (sinusoide a 60Hz con decadimento).
+    Gli impulsi hanno un jitter casuale per non essere in fase con il timer.
+    Restituisce (campioni float32, tempi degli impulsi in ms).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration_s * sample_rate)
+    audio = (rng.standard_normal(n) * noise_level).astype(np.float32)
+
+    hit_len = int(0.12 * sample_rate)
+    t = np.arange(hit_len) / sample_rate
+    hit = (0.95 * np.sin(2 * np.pi * 60 * t) * np.exp(-t * 30)).astype(np.float32)
+
+    onsets_ms = []
+    start = 1.0
+    while start + 0.2 < duration_s:
+        onset = start + rng.uniform(0, jitter_s)
+        idx = int(onset * sample_rate)
+        end = min(idx + hit_len, n)
+        audio[idx:end] += hit[:end - idx]
+        onsets_ms.append(onset * 1000.0)
+        start += interval_s
+
+    return np.clip(audio, -1.0, 1.0), np.array(onsets_ms)
+
+
+def run_config(audio, gan, onsets_ms, duration_ms, fps, window, granularity_ms, sink_latency_ms,
+               audio_latency_ms, metric, clock, seed, beat_grid=False):
+    """Esegue una configurazione e restituisce (latenze in ms, tempi di inferenza, n. impulsi mancati)."""
+    player = SimulatedPlayer(granularity_ms)
+    audio.player = player
+    period_ms = 1000.0 / fps
+
+    # Stato del latent walk identico per ogni configurazione
+    torch.manual_seed(seed)
+    gan.current_z = torch.randn(1, gan.latent_dim).to(gan.device)
+    gan.target_z = torch.randn(1, gan.latent_dim).to(gan.device)
+    if gan.post_fx is not None:
+        gan.post_fx.reset()
+    audio.reset_beat_events()
+
+    present_times, values, inference_ms = [], [], []
+    prev_z, prev_frame = gan.current_z.clone(), None
+
+    t0 = time.perf_counter()
+    t_ms = 0.0
+    while t_ms < duration_ms:
+        player.clock_ms = t_ms
+        chunk = audio.get_current_chunk(window_size=window)
+
+        beat_events = audio.get_beat_events() if beat_grid else None
+
+        start = time.perf_counter()
+        frame = gan.generate_image(chunk, beat_events=beat_events)
+        infer = (time.perf_counter() - start) * 1000.0
+        inference_ms.append(infer)
+
+        if metric == 'latent':
+            values.append(float(torch.norm(gan.current_z - prev_z)))
+            prev_z = gan.current_z.clone()
+        else:
+            current = frame.astype(np.float32)
+            values.append(0.0 if prev_frame is None else float(np.mean(np.abs(current - prev_frame))))
+            prev_frame = current
+
+        present_times.append(t_ms + infer + sink_latency_ms)
+
+        # QTimer: tick ogni periodo, ma se il frame sfora il successivo parte subito dopo
+        next_tick = t_ms + max(period_ms, infer)
+        if clock == 'real':
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            if next_tick > elapsed:
+                time.sleep((next_tick - elapsed) / 1000.0)
+            t_ms = (time.perf_counter() - t0) * 1000.0
+        else:
+            t_ms = next_tick
+
+    return _detect(np.array(present_times), np.array(values), onsets_ms + audio_latency_ms), inference_ms
+
+
+def _detect(present_times, values, onsets_ms, k=6.0, max_window_ms=400.0):
+    """Primo frame dopo ogni impulso con metrica oltre la soglia robusta (mediana + k * MAD)."""
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * 1.4826
+    threshold = median + k * max(mad, 1e-6)
+
+    latencies, missed = [], 0
+    for i, onset in enumerate(onsets_ms):
+        limit = onset + max_window_ms
+        if i + 1 < len(onsets_ms):
+            limit = min(limit, onsets_ms[i + 1])
+
+        lo, hi = np.searchsorted(present_times, [onset, limit])
+        hits = np.nonzero(values[lo:hi] > threshold)[0]
+        if len(hits) == 0:
+            missed += 1
+        else:
+            latencies.append(present_times[lo + hits[0]] - onset)
+
+    return np.array(latencies), missed
+
+
+def summarize(latencies, inference_ms, missed):
+    if len(latencies) == 0:
+        return {'detected': 0, 'missed': missed}
+    return {
+        'detected': int(len(latencies)),
+        'missed': int(missed),
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'max_ms': float(np.max(latencies)),
+        'min_ms': float(np.min(latencies)),
+        'inference_mean_ms': float(np.mean(inference_ms)),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Misura della latenza audio -> visual")
+    parser.add_argument('--model', required=True, help="Checkpoint .pt del Generator")
+    parser.add_argument('--use-gpu', action='store_true')
+    parser.add_argument('--static-inference', action='store_true')
+    parser.add_argument('--attn-res-layers', type=int, nargs='*', default=[],
+                        help="Risoluzioni con LinearAttention del checkpoint (come ATTN_RES_LAYERS)")
+    parser.add_argument('--attn-mode', choices=['efficient', 'unfold', 'both'], default='efficient',
+                        help="Attention locale a finestre traslate, con F.unfold, o entrambe sullo stesso modello")
+    parser.add_argument('--fps', type=int, nargs='+', default=[30])
+    parser.add_argument('--window', type=int, nargs='+', default=[1024])
+    parser.add_argument('--granularity', type=float, nargs='+', default=[10.0],
+                        help="Granularità di player.position() in ms")
+    parser.add_argument('--sink-latency', type=float, default=0.0, help="Latenza del sink (Spout/display) in ms")
+    parser.add_argument('--audio-latency', type=float, default=0.0, help="Latenza dell'uscita audio in ms")
+    parser.add_argument('--metric', choices=['latent', 'frame'], default='latent')
+    parser.add_argument('--beat-grid', action='store_true',
+                        help="Usa la beat grid pre-calcolata per i kick invece della soglia sul volume")
+    parser.add_argument('--clock', choices=['sim', 'real'], default='sim')
+    parser.add_argument('--duration', type=float, default=20.0, help="Durata della traccia sintetica in secondi")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help="Salva i risultati in un file JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = QCoreApplication(sys.argv)
+
+    audio = AudioManager()
+    samples, onsets_ms = synth_impulse_track(duration_s=args.duration, seed=args.seed)
+    audio.full_audio_data = samples
+    audio.sample_rate = 44100
+    if args.beat_grid:
+        audio.current_analysis = analyze_track(samples, audio.sample_rate)
+
+    gan = GANManager(model_path=args.model, use_gpu=args.use_gpu, eval_mode=True,
+                     static_inference=args.static_inference,
+                     attn_res_layers=args.attn_res_layers,
+                     memory_efficient_attn=args.attn_mode != 'unfold')
+
+    # Con 'both' il modello viene caricato una volta e l'attention cambiata a caldo
+    attn_modes = [True, False] if args.attn_mode == 'both' else [args.attn_mode != 'unfold']
+
+    results = []
+    for efficient_attn, fps, window, granularity in itertools.product(attn_modes, args.fps, args.window,
+                                                                       args.granularity):
+        gan.set_memory_efficient_attention(efficient_attn)
+        label = f"attn={'efficient' if efficient_attn else 'unfold'} fps={fps} window={window} gran={granularity}ms"
+        (latencies, missed), inference_ms = run_config(
+            audio, gan, onsets_ms, args.duration * 1000.0, fps, window, granularity,
+            args.sink_latency, args.audio_latency, args.metric, args.clock, args.seed, args.beat_grid
+        )
+        summary = summarize(latencies, inference_ms, missed)
+        summary.update({'fps': fps, 'window': window, 'granularity_ms': granularity,
+                        'memory_efficient_attn': efficient_attn})
+        results.append(summary)
+
+        if summary['detected']:
+            log.info(f"{label} -> "
+                     f"p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+                     f"max {summary['max_ms']:.1f} ms, mancati {missed}/{len(onsets_ms)}, "
+                     f"inferenza {summary['inference_mean_ms']:.1f} ms")
+        else:
+            log.warning(f"{label} -> nessuna reazione rilevata")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        log.success(f"Risultati salvati in {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import sys
+import time
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import QTimer
 from PyQt6.QtMultimedia import QMediaPlayer
@@ -9,6 +10,12 @@ import OpenGL.GL as GL
 from audio_manager import AudioManager
 from gui import GUI
 from gan_manager import GANManager
+from frame_broadcaster import FrameBroadcaster
+from resource_manager import ResourceManager
+from utils.post_fx import build_post_fx
+from utils.audio_features import band_energies
+from utils.beat_analysis import analyze_track
+from control_stream import ControlPublisher
 from utils.custom_enum import FPS, SampleWindowSize
 
 import utils.logutils as log
@@ -23,6 +30,44 @@ SAMPLE_WINDOW_SIZE = SampleWindowSize.WS_1024
 MODEL_PATH = './resources/models/light_gan_test/model_5.pt'
 USE_GPU = False
 EVAL_MODE = False
+# Risoluzioni con LinearAttention del checkpoint (es. [32, 64]) e variante a basso consumo di memoria
+ATTN_RES_LAYERS = []
+MEMORY_EFFICIENT_ATTN = True
+# Inferenza con buffer statici e banco di rumore pre-generato (CUDA Graph su GPU)
+STATIC_INFERENCE = False
+
+# Post-processing sul device prima dell'invio (upscale, scie, color grading)
+POST_FX_ENABLED = False
+POST_FX_UPSCALE = 2
+POST_FX_FEEDBACK = 0.85
+POST_FX_LUT_PATH = None
+
+# Playlist: tracce successive pre-decodificate in background (entro il budget di memoria)
+PLAYLIST_PRELOAD_AHEAD = 2
+DECODE_MEMORY_BUDGET_MB = 512
+
+# Analisi ritmica in background (onset, kick, beat/downbeat) che guida kick e cambi di target
+BEAT_ANALYSIS = True
+
+# Benchmark dei thread torch al primo avvio (profilo salvato per macchina)
+AUTO_TUNE = True
+RESOURCE_PROFILE_PATH = './resources/tuning/resource_profile.json'
+
+# Anteprima OpenGL (texture persistente scalata dalla GPU), fallback su QLabel
+USE_GL_PREVIEW = True
+
+# Feature audio ed eventi del latent walk verso TouchDesigner (OSC su UDP)
+CONTROL_STREAM_ENABLED = False
+CONTROL_STREAM_HOST = '127.0.0.1'
+CONTROL_STREAM_PORT = 7000
+
+# Log anche su file JSON-lines (None = solo console)
+LOG_JSON_PATH = None
+
+# Streaming dei frame in rete (MJPEG su HTTP, raw su WebSocket/TCP)
+STREAM_ENABLED = False
+STREAM_HTTP_PORT = 8080
+STREAM_TCP_PORT = None
 
 def log_constants():
     log.info("Starting application with the following constants:")
@@ -31,28 +76,82 @@ def log_constants():
     log.info(f"MODEL_PATH: {MODEL_PATH}")
     log.info(f"USE_GPU: {USE_GPU}")
     log.info(f"EVAL_MODE: {EVAL_MODE}")
+    log.info(f"ATTN_RES_LAYERS: {ATTN_RES_LAYERS}")
+    log.info(f"STATIC_INFERENCE: {STATIC_INFERENCE}")
+    log.info(f"POST_FX_ENABLED: {POST_FX_ENABLED}")
+    log.info(f"BEAT_ANALYSIS: {BEAT_ANALYSIS}")
+    log.info(f"AUTO_TUNE: {AUTO_TUNE}")
+    log.info(f"USE_GL_PREVIEW: {USE_GL_PREVIEW}")
+    log.info(f"STREAM_ENABLED: {STREAM_ENABLED}")
+    log.info(f"CONTROL_STREAM_ENABLED: {CONTROL_STREAM_ENABLED}")
 
 ########################
 
 class VisualizerApp:
     def __init__(self):
+        # Divide i core tra inferenza (questo thread) e decodifica audio
+        self.resource_manager = ResourceManager(profile_path=RESOURCE_PROFILE_PATH)
+
         # Inizializza audio e gui managers
-        self.audio_system = AudioManager()
-        self.window = GUI(self.audio_system, img_size=256)
+        self.audio_system = AudioManager(
+            resource_manager=self.resource_manager,
+            preload_ahead=PLAYLIST_PRELOAD_AHEAD,
+            memory_budget_mb=DECODE_MEMORY_BUDGET_MB
+        )
+        if BEAT_ANALYSIS:
+            self.audio_system.analyzers.append(analyze_track)
+        self.window = GUI(self.audio_system, img_size=256, use_gl=USE_GL_PREVIEW)
+
+        self.spout_sender = SpoutGL.SpoutSender()
+        self.spout_name = "GAN_Visualizer_TD"
+        self.spout_sender.setSenderName(self.spout_name)
+        log.info(f"Spout Sender avviato con nome: {self.spout_name}")
+
+        # Server di streaming in rete (thread ed event loop dedicati)
+        self.broadcaster = None
+        if STREAM_ENABLED:
+            self.broadcaster = FrameBroadcaster(http_port=STREAM_HTTP_PORT, tcp_port=STREAM_TCP_PORT)
+            self.broadcaster.start()
+
+        # Publisher delle feature audio per consumer esterni
+        self.control_publisher = None
+        self.frame_index = 0
+        if CONTROL_STREAM_ENABLED:
+            self.control_publisher = ControlPublisher(host=CONTROL_STREAM_HOST, port=CONTROL_STREAM_PORT)
+        
+        # Pinning del thread di inferenza solo ora: i thread creati finora (audio Qt, GUI,
+        # event loop e encoder dello streaming, control stream) non ereditano i core
+        # dell'inferenza; il pool intra-op di torch nasce al primo forward, subito dopo
+        self.resource_manager.setup_inference_thread()
 
         self.gan_manager = GANManager(
             model_path=MODEL_PATH, 
             image_size=256, 
             latent_dim=256,
             use_gpu=USE_GPU,
-            eval_mode=EVAL_MODE
+            eval_mode=EVAL_MODE,
+            attn_res_layers=ATTN_RES_LAYERS,
+            memory_efficient_attn=MEMORY_EFFICIENT_ATTN,
+            static_inference=STATIC_INFERENCE
         )
-        
-        self.spout_sender = SpoutGL.SpoutSender()
-        self.spout_name = "GAN_Visualizer_TD"
-        self.spout_sender.setSenderName(self.spout_name)
-        log.info(f"Spout Sender avviato con nome: {self.spout_name}")
-        
+
+        if POST_FX_ENABLED:
+            self.gan_manager.post_fx = build_post_fx(
+                self.gan_manager.device,
+                upscale=POST_FX_UPSCALE,
+                feedback=POST_FX_FEEDBACK,
+                lut_path=POST_FX_LUT_PATH
+            )
+
+        if AUTO_TUNE:
+            self.resource_manager.tune(
+                self.gan_manager.model,
+                latent_dim=self.gan_manager.latent_dim,
+                device=self.gan_manager.device,
+                image_size=self.gan_manager.image_size,
+                model_id=self.gan_manager.model_path
+            )
+
         # Configura il timer loop
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_loop)
@@ -66,10 +165,27 @@ class VisualizerApp:
         if self.audio_system.player.playbackState() != QMediaPlayer.PlaybackState.PlayingState:
             return
 
+        frame_start = time.perf_counter()
+
         # Recupero un chunk audio di una finestra temporale
         chunk = self.audio_system.get_current_chunk(window_size=SAMPLE_WINDOW_SIZE)
 
-        final_image = self.gan_manager.generate_image(chunk)
+        # Eventi ritmici pre-calcolati nell'intervallo trascorso dal frame precedente
+        beat_events = self.audio_system.get_beat_events()
+
+        final_image = self.gan_manager.generate_image(chunk, beat_events=beat_events)
+        self.frame_index += 1
+
+        # Feature del frame (stesse che guidano il latent walk) + energie per banda
+        if self.control_publisher is not None and final_image is not None:
+            features = dict(self.gan_manager.last_features)
+            features.update(band_energies(chunk, self.audio_system.sample_rate))
+            self.control_publisher.publish(
+                self.frame_index,
+                self.audio_system.player.position() / 1000.0,
+                features,
+                self.gan_manager.last_events
+            )
         if final_image is not None:
             self.window.set_image(final_image)
 
@@ -82,14 +198,29 @@ class VisualizerApp:
             # invia l'immagine al canale spout
             self.spout_sender.sendImage(final_image.tobytes(), width, height, GL.GL_RGB, False, 0)
 
+            # invia l'immagine ai client in rete (non blocca: la codifica avviene nel thread del server)
+            if self.broadcaster is not None:
+                self.broadcaster.publish(final_image)
+
+        # Frame oltre il budget del timer: warning aggregato (non blocca il loop)
+        frame_ms = (time.perf_counter() - frame_start) * 1000.0
+        if frame_ms > FRAMERATE:
+            log.rate_limited('warning', 'late_frame', "Frame in ritardo", interval=2.0,
+                             stage='render', frame_ms=frame_ms, budget_ms=float(FRAMERATE))
+
     def __del__(self):
         # Rilascia la memoria di Spout quando l'applicazione si chiude
         if hasattr(self, 'spout_sender'):
             self.spout_sender.releaseSender()
+        if getattr(self, 'broadcaster', None) is not None:
+            self.broadcaster.stop()
+        if getattr(self, 'control_publisher', None) is not None:
+            self.control_publisher.close()
 
 
 def main():
     app = QApplication(sys.argv)
+    log.configure(console=True, json_path=LOG_JSON_PATH)
     log_constants()
     try:
         controller = VisualizerApp()
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import ctypes
+
+import numpy as np
+import torch
+
+import utils.logutils as log
+
+
+class ResourceManager:
+    """
+    Gestione dei core CPU condivisi tra inferenza (thread principale Qt + thread
+    intra-op di torch) e decodifica audio (`_pydub_worker`).
+    - Divide i core in due insiemi disgiunti: inferenza e decodifica.
+    - Imposta `torch.set_num_threads` / `torch.set_num_interop_threads`.
+    - Al primo avvio misura il `Generator` con diversi numeri di thread e salva
+      la configurazione migliore per la macchina corrente.
+    """
+
+    def __init__(self, profile_path='./resources/tuning/resource_profile.json', decode_cores=None):
+        self.profile_path = profile_path
+
+        all_cores = sorted(_available_cores())
+        if decode_cores is None:
+            # Un core ogni 4 (minimo 1) riservato alla decodifica, presi dalla fine
+            n_decode = max(1, len(all_cores) // 4) if len(all_cores) > 1 else 0
+            decode_cores = all_cores[len(all_cores) - n_decode:]
+
+        self.decode_cores = sorted(set(decode_cores) & set(all_cores))
+        self.inference_cores = [c for c in all_cores if c not in self.decode_cores] or all_cores
+        if not self.decode_cores:
+            self.decode_cores = all_cores
+
+        self.config = None
+
+    ### Configurazione ###
+
+    def machine_key(self, device, image_size, model=None, model_id=None):
+        """
+        Identifica macchina + configurazione del modello per il profilo salvato.
+        `model` (numero di parametri) e `model_id` (es. path del checkpoint) distinguono
+        Generator diversi alla stessa risoluzione, es. teacher e studente distillato.
+        """
+        parts = [
+            platform.node(),
+            platform.processor() or platform.machine(),
+            str(os.cpu_count()),
+            f"torch-{torch.__version__}",
+            str(device),
+            f"img-{image_size}",
+        ]
+        if model is not None:
+            parts.append(f"{type(model).__name__}-{sum(p.numel() for p in model.parameters())}")
+        if model_id is not None:
+            parts.append(str(model_id))
+        return "|".join(parts)
+
+    def setup_inference_thread(self):
+        """
+        Da chiamare nel thread che esegue l'inferenza PRIMA del primo forward e DOPO
+        aver creato gli altri thread dell'applicazione (audio, GUI, streaming), che
+        altrimenti erediterebbero anch'essi i core dell'inferenza.
+        Su Linux i thread OpenMP di torch ereditano l'affinità del thread che li crea,
+        quindi tutta l'inferenza resta sui core dedicati. Su Windows i nuovi thread
+        partono con la maschera del processo: il pool intra-op non è vincolato ai core,
+        solo limitato nel numero (`apply`); l'isolamento reale è quello del thread di
+        decodifica, fissato sui suoi core e a priorità bassa.
+        """
+        if not pin_current_thread(self.inference_cores):
+            return
+        if sys.platform == 'win32':
+            log.info(f"Resource Manager: thread Qt sui core {self.inference_cores} "
+                     f"(su Windows i thread di torch non ereditano l'affinità)")
+        else:
+            log.info(f"Resource Manager: inferenza sui core {self.inference_cores}")
+
+    def setup_decode_thread(self):
+        """Da chiamare all'avvio del thread di decodifica: core dedicati e priorità bassa."""
+        pin_current_thread(self.decode_cores)
+        lower_current_thread_priority()
+
+    def tune(self, model, latent_dim, device, image_size, model_id=None, force=False):
+        """
+        Carica la configurazione salvata per questa macchina e questo modello, oppure
+        esegue il benchmark del modello e la salva. Applica subito il risultato.
+        """
+        key = self.machine_key(device, image_size, model=model, model_id=model_id)
+        profiles = self._load_profiles()
+
+        config = None if force else profiles.get(key)
+        if config is None:
+            log.info("Resource Manager: nessun profilo per questa macchina, avvio benchmark...")
+            config = self.benchmark(model, latent_dim, device)
+            profiles[key] = config
+            self._save_profiles(profiles)
+        else:
+            log.info(f"Resource Manager: profilo caricato ({config['num_threads']} thread)")
+
+        self.apply(config)
+        return config
+
+    def apply(self, config):
+        self.config = config
+        torch.set_num_threads(config['num_threads'])
+        try:
+            torch.set_num_interop_threads(config['interop_threads'])
+        except RuntimeError:
+            # Consentito una sola volta e prima di qualsiasi lavoro inter-op
+            log.warning("Resource Manager: thread inter-op già inizializzati, impostazione ignorata.")
+
+    def benchmark(self, model, latent_dim, device, warmup=3, iterations=15):
+        """Misura il tempo mediano di un forward del `Generator` per ogni numero di thread candidato."""
+        candidates = _thread_candidates(len(self.inference_cores))
+        previous_threads = torch.get_num_threads()
+        results = {}
+
+        # In eval per non alterare le statistiche di BatchNorm durante le misure
+        was_training = model.training
+        model.eval()
+
+        z = torch.randn(1, latent_dim, device=device)
+        with torch.no_grad():
+            for n_threads in candidates:
+                torch.set_num_threads(n_threads)
+                for _ in range(warmup):
+                    model(z)
+
+                timings = []
+                for _ in range(iterations):
+                    if device.type == 'cuda':
+                        torch.cuda.synchronize()
+                    start = time.perf_counter()
+                    model(z)
+                    if device.type == 'cuda':
+                        torch.cuda.synchronize()
+                    timings.append((time.perf_counter() - start) * 1000.0)
+
+                results[n_threads] = float(np.median(timings))
+                log.info(f"Resource Manager: {n_threads} thread -> {results[n_threads]:.2f} ms/frame")
+
+        model.train(was_training)
+        torch.set_num_threads(previous_threads)
+        best = min(results, key=results.get)
+        log.success(f"Resource Manager: configurazione migliore {best} thread ({results[best]:.2f} ms/frame)")
+
+        return {
+            'num_threads': best,
+            'interop_threads': 1,
+            'inference_cores': self.inference_cores,
+            'decode_cores': self.decode_cores,
+            'timings_ms': {str(k): v for k, v in results.items()},
+        }
+
+    ### Persistenza ###
+
+    def _load_profiles(self):
+        if not os.path.exists(self.profile_path):
+            return {}
+        try:
+            with open(self.profile_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"Resource Manager: profilo non leggibile ({e}), verrà rigenerato.")
+            return {}
+
+    def _save_profiles(self, profiles):
+        try:
+            os.makedirs(os.path.dirname(self.profile_path) or '.', exist_ok=True)
+            with open(self.profile_path, 'w', encoding='utf-8') as f:
+                json.dump(profiles, f, indent=2)
+        except OSError as e:
+            log.warning(f"Resource Manager: impossibile salvare il profilo: {e}")
+
+
+def _available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return os.sched_getaffinity(0)
+    return set(range(os.cpu_count() or 1))
+
+
+def _thread_candidates(max_threads):
+    candidates = []
+    n = 1
+    while n < max_threads:
+        candidates.append(n)
+        n *= 2
+    candidates.append(max_threads)
+    return candidates
+
+
+def pin_current_thread(cores):
+    """Limita il thread corrente ai core indicati. Ritorna False se non supportato."""
+    if not cores:
+        return False
+    try:
+        if sys.platform.startswith('linux'):
+            # Su Linux pid 0 indica il thread chiamante, non l'intero processo
+            os.sched_setaffinity(0, cores)
+            return True
+        if sys.platform == 'win32':
+            mask = 0
+            for core in cores:
+                mask |= 1 << core
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentThread.restype = ctypes.c_void_p
+            kernel32.SetThreadAffinityMask.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            return kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), mask) != 0
+    except (OSError, AttributeError) as e:
+        log.warning(f"Resource Manager: impossibile impostare l'affinità dei core: {e}")
+    return False
+
+
+def lower_current_thread_priority():
+    """Abbassa la priorità del thread corrente (best effort)."""
+    try:
+        if sys.platform.startswith('linux'):
+            # Su Linux la niceness è per-thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+            return True
+        if sys.platform == 'win32':
+            THREAD_PRIORITY_LOWEST = -2
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentThread.restype = ctypes.c_void_p
+            kernel32.SetThreadPriority.argtypes = [ctypes.c_void_p, ctypes.c_int]
+            return kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_LOWEST) != 0
+    except (OSError, AttributeError) as e:
+        log.warning(f"Resource Manager: impossibile abbassare la priorità del thread: {e}")
+    return False
@@ -0,0 +1,43 @@
+import numpy as np
+
+# Bande di frequenza (Hz) per le energie inviate ai consumer esterni
+DEFAULT_BANDS = {
+    'low': (20, 150),
+    'mid': (150, 2000),
+    'high': (2000, 16000),
+}
+
+_windows = {}
+
+def _hann(size):
+    # Finestra cache-ata per dimensione: niente allocazioni ad ogni frame
+    window = _windows.get(size)
+    if window is None:
+        window = np.hanning(size).astype(np.float32)
+        _windows[size] = window
+    return window
+
+def rms(audio_chunk):
+    """Volume RMS del chunk."""
+    if len(audio_chunk) == 0:
+        return 0.0
+    return float(np.linalg.norm(audio_chunk) / np.sqrt(len(audio_chunk)))
+
+def band_energies(audio_chunk, sample_rate, bands=DEFAULT_BANDS):
+    """
+    Energia media (RMS spettrale) per banda sul chunk corrente.
+    Restituisce un dict {nome_banda: energia}.
+    """
+    n = len(audio_chunk)
+    if n == 0:
+        return {name: 0.0 for name in bands}
+
+    spectrum = np.abs(np.fft.rfft(audio_chunk * _hann(n))) / n
+    freqs = np.fft.rfftfreq(n, d=1.0 / sample_rate)
+
+    energies = {}
+    for name, (lo, hi) in bands.items():
+        lo_idx, hi_idx = np.searchsorted(freqs, [lo, hi])
+        band = spectrum[lo_idx:hi_idx]
+        energies[name] = float(np.sqrt(np.mean(band ** 2))) if len(band) else 0.0
+    return energies
@@ -0,0 +1,219 @@
+import numpy as np
+
+# Analisi ritmica offline della traccia decodificata (eseguita nel thread di decodifica).
+# Produce array ordinati di tempi (secondi): onset, kick (con intensità), beat e downbeat.
+# In riproduzione gli eventi si interrogano con una ricerca binaria sull'intervallo
+# (t0, t1] coperto dal frame: ogni evento viene raccolto una sola volta, a qualunque framerate.
+
+N_FFT = 2048
+HOP = 512
+KICK_MAX_HZ = 150
+TEMPO_RANGE_BPM = (60, 180)
+TEMPO_PRIOR_BPM = 120
+BEATS_PER_BAR = 4
+
+
+class BeatGrid:
+    """Eventi ritmici di una traccia come array ordinati, interrogabili per intervallo di tempo."""
+    def __init__(self, tempo, onsets, kicks, kick_strengths, beats, downbeats):
+        self.tempo = tempo
+        self.onsets = onsets
+        self.kicks = kicks
+        self.kick_strengths = kick_strengths
+        self.beats = beats
+        self.downbeats = downbeats
+
+    @staticmethod
+    def _span(times, t0, t1):
+        # Intervallo semiaperto (t0, t1]: frame consecutivi non raccolgono mai lo stesso evento
+        return np.searchsorted(times, [t0, t1], side='right')
+
+    def kicks_between(self, t0, t1):
+        """Intensità (0-1) dei kick in (t0, t1]."""
+        lo, hi = self._span(self.kicks, t0, t1)
+        return self.kick_strengths[lo:hi]
+
+    def beats_between(self, t0, t1):
+        lo, hi = self._span(self.beats, t0, t1)
+        return hi - lo
+
+    def downbeats_between(self, t0, t1):
+        lo, hi = self._span(self.downbeats, t0, t1)
+        return hi - lo
+
+    def next_beat(self, t):
+        """Tempo del primo beat dopo `t` (None a fine traccia): utile per pianificare in anticipo."""
+        idx = np.searchsorted(self.beats, t, side='right')
+        return float(self.beats[idx]) if idx < len(self.beats) else None
+
+
+def analyze_track(audio, sample_rate):
+    """Analyzer per `AudioManager.analyzers`: restituisce {'beat_grid': BeatGrid}."""
+    return {'beat_grid': compute_beat_grid(audio, sample_rate)}
+
+
+def compute_beat_grid(audio, sample_rate):
+    env_rate = sample_rate / HOP
+    full_flux, low_flux = _onset_envelopes(audio, sample_rate)
+
+    onset_frames = _pick_peaks(full_flux, env_rate, min_gap_s=0.05)
+    kick_frames = _pick_peaks(low_flux, env_rate, min_gap_s=0.1)
+
+    # Intensità dei kick normalizzata sul 95° percentile della traccia
+    kick_strengths = np.zeros(0, dtype=np.float32)
+    if len(kick_frames):
+        ref = np.percentile(low_flux[kick_frames], 95)
+        kick_strengths = np.clip(low_flux[kick_frames] / max(ref, 1e-9), 0.0, 1.0).astype(np.float32)
+
+    # Envelope per tempo e beat: basse con peso doppio, così la griglia si aggancia alla cassa
+    # e non a hi-hat/controtempi
+    beat_env = 0.5 * full_flux / (full_flux.max() + 1e-9) + low_flux / (low_flux.max() + 1e-9)
+    period = _estimate_period(beat_env, env_rate)
+    beat_frames = _track_beats(beat_env, period)
+    downbeat_frames = _downbeats(beat_frames, low_flux)
+
+    to_time = lambda frames: np.asarray(frames, dtype=np.float64) / env_rate
+    return BeatGrid(
+        tempo=60.0 * env_rate / period,
+        onsets=to_time(onset_frames),
+        kicks=to_time(kick_frames),
+        kick_strengths=kick_strengths,
+        beats=to_time(beat_frames),
+        downbeats=to_time(downbeat_frames),
+    )
+
+
+def _onset_envelopes(audio, sample_rate, block=1024):
+    """
+    Spectral flux (somma delle differenze positive del log-spettro) su tutta
+    la banda e sotto `KICK_MAX_HZ`. STFT centrata, calcolata a blocchi di frame
+    per non allocare l'intero spettrogramma.
+    """
+    padded = np.pad(audio.astype(np.float32), (N_FFT // 2, N_FFT // 2))
+    n_frames = 1 + (len(padded) - N_FFT) // HOP
+    if n_frames < 2:
+        return np.zeros(max(n_frames, 1), dtype=np.float32), np.zeros(max(n_frames, 1), dtype=np.float32)
+
+    window = np.hanning(N_FFT).astype(np.float32)
+    low_bins = int(KICK_MAX_HZ * N_FFT / sample_rate) + 1
+    frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT)[::HOP]
+
+    full_flux = np.zeros(n_frames, dtype=np.float32)
+    low_flux = np.zeros(n_frames, dtype=np.float32)
+    prev = None
+    for start in range(0, n_frames, block):
+        mag = np.abs(np.fft.rfft(frames[start:start + block] * window, axis=1))
+        mag_prev = np.vstack([mag[:1] if prev is None else prev, mag[:-1]])
+        prev = mag[-1:]
+
+        # Banda piena: log-compressione (sensibile anche ad attacchi deboli)
+        full_diff = np.log1p(100.0 * mag) - np.log1p(100.0 * mag_prev)
+        full_flux[start:start + len(mag)] = np.maximum(full_diff, 0.0).sum(axis=1)
+
+        # Basse: magnitudine lineare, così rumore e hi-hat a banda larga non sembrano kick
+        low_diff = mag[:, :low_bins] - mag_prev[:, :low_bins]
+        low_flux[start:start + len(mag)] = np.maximum(low_diff, 0.0).sum(axis=1)
+
+    return full_flux, low_flux
+
+
+def _pick_peaks(envelope, env_rate, min_gap_s, delta=0.1):
+    """Massimi locali sopra la media mobile (~0.2 s) + soglia relativa, distanziati di almeno `min_gap_s`."""
+    if len(envelope) < 3 or envelope.max() <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    env = envelope / envelope.max()
+    radius = max(1, int(0.1 * env_rate))
+    kernel = np.ones(2 * radius + 1) / (2 * radius + 1)
+    local_mean = np.convolve(env, kernel, mode='same')
+
+    is_peak = (env[1:-1] >= env[:-2]) & (env[1:-1] > env[2:]) & (env[1:-1] > local_mean[1:-1] + delta)
+    candidates = np.nonzero(is_peak)[0] + 1
+
+    min_gap = max(1, int(min_gap_s * env_rate))
+    picked = []
+    for idx in candidates:
+        if picked and idx - picked[-1] < min_gap:
+            if env[idx] > env[picked[-1]]:
+                picked[-1] = idx
+            continue
+        picked.append(idx)
+    return np.array(picked, dtype=np.int64)
+
+
+def _estimate_period(envelope, env_rate):
+    """
+    Periodo del beat (in frame) dall'autocorrelazione dell'envelope, con prior log-gaussiano
+    su 120 BPM. Il risultato è sempre entro `TEMPO_RANGE_BPM`; senza onset (silenzio) si usa il prior.
+    """
+    env = envelope - envelope.mean()
+    min_period = 60.0 * env_rate / TEMPO_RANGE_BPM[1]
+    max_period = 60.0 * env_rate / TEMPO_RANGE_BPM[0]
+    prior_period = 60.0 * env_rate / TEMPO_PRIOR_BPM
+    min_lag = int(np.ceil(min_period))
+    max_lag = int(max_period)
+    if len(env) <= max_lag + 1:
+        return prior_period
+
+    # Autocorrelazione via FFT
+    n = 1 << int(np.ceil(np.log2(2 * len(env))))
+    spectrum = np.fft.rfft(env, n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum), n)[:max_lag + 2]
+    if acf[0] <= 1e-12:
+        return prior_period
+
+    lags = np.arange(min_lag, max_lag + 1)
+    bpm = 60.0 * env_rate / lags
+    prior = np.exp(-0.5 * (np.log2(bpm / TEMPO_PRIOR_BPM) / 1.0) ** 2)
+    best = lags[np.argmax(acf[min_lag:max_lag + 1] * prior)]
+
+    # Raffinamento sub-frame (interpolazione parabolica), solo su un vero massimo locale
+    # dell'autocorrelazione: il massimo pesato dal prior può cadere su un fianco
+    if min_lag < best < max_lag:
+        a, b, c = acf[best - 1], acf[best], acf[best + 1]
+        denom = a - 2 * b + c
+        if a <= b >= c and denom < 0:
+            best = best + np.clip(0.5 * (a - c) / denom, -0.5, 0.5)
+    return float(np.clip(best, min_period, max_period))
+
+
+def _track_beats(envelope, period, tightness=100.0):
+    """
+    Beat tracking a programmazione dinamica (Ellis, 2007): massimizza l'energia
+    di onset sui beat penalizzando gli intervalli lontani dal periodo stimato.
+    """
+    n = len(envelope)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    env = envelope / (envelope.std() + 1e-9)
+    lags = np.arange(int(np.round(period / 2)), int(np.round(period * 2)) + 1)
+    penalty = -tightness * np.log(lags / period) ** 2
+
+    score = env.astype(np.float64).copy()
+    backlink = np.full(n, -1, dtype=np.int64)
+    for t in range(lags[0], n):
+        valid = lags[lags <= t]
+        candidates = score[t - valid] + penalty[:len(valid)]
+        best = np.argmax(candidates)
+        if candidates[best] > 0:
+            score[t] += candidates[best]
+            backlink[t] = t - valid[best]
+
+    # Ultimo beat: massimo dello score nell'ultimo periodo
+    tail = max(0, n - int(np.ceil(period)))
+    t = tail + int(np.argmax(score[tail:]))
+    beats = []
+    while t >= 0:
+        beats.append(t)
+        t = backlink[t]
+    return np.array(beats[::-1], dtype=np.int64)
+
+
+def _downbeats(beat_frames, low_envelope):
+    """Fase della battuta (1 beat su BEATS_PER_BAR) con più energia nelle basse (kick sul primo tempo)."""
+    if len(beat_frames) < BEATS_PER_BAR:
+        return beat_frames[:1]
+    energy = low_envelope[beat_frames]
+    phase = int(np.argmax([energy[p::BEATS_PER_BAR].mean() for p in range(BEATS_PER_BAR)]))
+    return beat_frames[phase::BEATS_PER_BAR]
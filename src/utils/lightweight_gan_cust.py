@@ -62,10 +62,18 @@ class Noise(nn.Module):
     def __init__(self):
         super().__init__()
         self.weight = nn.Parameter(torch.zeros(1))
+        # buffer statico opzionale (b, 1, h, w) riempito dall'esterno (es. NoiseBank)
+        self.noise_buffer = None
 
     def forward(self, x, noise = None):
         b, _, h, w, device = *x.shape, x.device
 
+        if not exists(noise) and exists(self.noise_buffer):
+            # inferenza: x è l'uscita fresca della conv, si può modificare in-place
+            if not torch.is_grad_enabled():
+                return x.addcmul_(self.noise_buffer, self.weight)
+            noise = self.noise_buffer
+
         if not exists(noise):
             noise = torch.randn(b, 1, h, w, device = device)
 
@@ -121,7 +129,7 @@ class DepthWiseConv2d(nn.Module):
         return self.net(x)
 
 class LinearAttention(nn.Module):
-    def __init__(self, dim, dim_head = 64, heads = 8, kernel_size = 3):
+    def __init__(self, dim, dim_head = 64, heads = 8, kernel_size = 3, memory_efficient = False):
         super().__init__()
         self.scale = dim_head ** -0.5
         self.heads = heads
@@ -129,6 +137,8 @@ class LinearAttention(nn.Module):
         inner_dim = dim_head * heads
 
         self.kernel_size = kernel_size
+        # attenzione locale senza F.unfold (stessi pesi, stesso risultato)
+        self.memory_efficient = memory_efficient
         self.nonlin = nn.GELU()
 
         self.to_lin_q = nn.Conv2d(dim, inner_dim, 1, bias = False)
@@ -159,6 +169,20 @@ class LinearAttention(nn.Module):
         q, k, v = (self.to_q(fmap), *self.to_kv(fmap).chunk(2, dim = 1))
         q, k, v = map(lambda t: rearrange(t, 'b (h c) x y -> (b h) c x y', h = h), (q, k, v))
 
+        if self.memory_efficient:
+            full_out = self.local_attention_shifted(q, k, v)
+        else:
+            full_out = self.local_attention_unfold(q, k, v)
+        full_out = rearrange(full_out, '(b h) d x y -> b (h d) x y', h = h)
+
+        # add outputs of linear attention + conv like full attention
+        lin_out = self.nonlin(lin_out)
+        out = torch.cat((lin_out, full_out), dim = 1)
+        return self.to_out(out)
+
+    def local_attention_unfold(self, q, k, v):
+        x, y = q.shape[-2:]
+
         k = F.unfold(k, kernel_size = self.kernel_size, padding = self.kernel_size // 2)
         v = F.unfold(v, kernel_size = self.kernel_size, padding = self.kernel_size // 2)
 
@@ -172,12 +196,35 @@ class LinearAttention(nn.Module):
         attn = sim.softmax(dim = -1)
 
         full_out = einsum('b i j, b i j d -> b i d', attn, v)
-        full_out = rearrange(full_out, '(b h) (x y) d -> b (h d) x y', h = h, x = x, y = y)
+        return rearrange(full_out, 'b (x y) d -> b d x y', x = x, y = y)
 
-        # add outputs of linear attention + conv like full attention
-        lin_out = self.nonlin(lin_out)
-        out = torch.cat((lin_out, full_out), dim = 1)
-        return self.to_out(out)
+    def local_attention_shifted(self, q, k, v):
+        # Equivalente a local_attention_unfold senza materializzare k e v "srotolati"
+        # (kernel_size^2 volte la feature map): per ogni spostamento della finestra
+        # si usa una vista del tensore con padding e si accumula il risultato.
+        x, y = q.shape[-2:]
+        pad = self.kernel_size // 2
+        offsets = [(i, j) for i in range(self.kernel_size) for j in range(self.kernel_size)]
+
+        q = q * self.scale
+        k = F.pad(k, (pad, pad, pad, pad))
+        v = F.pad(v, (pad, pad, pad, pad))
+
+        # similarità: (kernel_size^2, b, x, y), una mappa per spostamento
+        sim = torch.stack([(q * k[..., i:i + x, j:j + y]).sum(dim = 1) for (i, j) in offsets])
+        sim = sim - sim.amax(dim = 0, keepdim = True).detach()
+
+        attn = sim.softmax(dim = 0)
+
+        out = torch.zeros_like(q)
+        for n, (i, j) in enumerate(offsets):
+            out.addcmul_(attn[n].unsqueeze(1), v[..., i:i + x, j:j + y])
+        return out
+
+def set_memory_efficient_attention(model, enabled = True):
+    for module in model.modules():
+        if isinstance(module, LinearAttention):
+            module.memory_efficient = enabled
 
 # ==========================================
 # Moduli Squeeze-Excitation (Global Context & FCA)
@@ -254,7 +301,9 @@ class Generator(nn.Module):
         transparent = False,
         greyscale = False,
         attn_res_layers = [],
-        freq_chan_attn = False
+        freq_chan_attn = False,
+        memory_efficient_attn = False,
+        use_sle = True
     ):
         super().__init__()
         resolution = log2(image_size)
@@ -289,7 +338,7 @@ class Generator(nn.Module):
 
         self.sle_map = ((3, 7), (4, 8), (5, 9), (6, 10))
         self.sle_map = list(filter(lambda t: t[0] <= resolution and t[1] <= resolution, self.sle_map))
-        self.sle_map = dict(self.sle_map)
+        self.sle_map = dict(self.sle_map) if use_sle else dict()
 
         self.num_layers_spatial_res = 1
 
@@ -298,7 +347,7 @@ class Generator(nn.Module):
 
             attn = None
             if image_width in attn_res_layers:
-                attn = PreNorm(chan_in, LinearAttention(chan_in))
+                attn = PreNorm(chan_in, LinearAttention(chan_in, memory_efficient = memory_efficient_attn))
 
             sle = None
             if res in self.sle_map:
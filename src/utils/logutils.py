@@ -1,4 +1,10 @@
 import enum
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
 
 class ColorEnum(enum.StrEnum):
@@ -7,18 +13,224 @@ class ColorEnum(enum.StrEnum):
     RED = "\033[91m"
     YELLOW = "\033[93m"
 
-def info(text):
-    print(f"{_build_message('INFO', text)}")
+# Logging non bloccante: i chiamanti accodano record strutturati
+# (livello, timestamp monotonic, stage, testo, campi) e un thread di
+# background li formatta e li scrive su console e/o file JSON-lines.
 
-def success(text):
-    print(f"{ColorEnum.GREEN}{_build_message('SUCCESS', text)}{ColorEnum.RESET}")
+_LEVEL_COLORS = {
+    'SUCCESS': ColorEnum.GREEN,
+    'ERROR': ColorEnum.RED,
+    'WARNING': ColorEnum.YELLOW,
+}
 
-def error(text):
-    print(f"{ColorEnum.RED}{_build_message('ERROR', text)}{ColorEnum.RESET}")
+# Oltre questa soglia i record vengono scartati (e contati) invece di crescere senza limite
+MAX_PENDING = 10000
 
-def warning(text):
-    print(f"{ColorEnum.YELLOW}{_build_message('WARNING', text)}{ColorEnum.RESET}")
+# Offset per ricostruire l'orario reale dal clock monotonic (calcolato una volta sola)
+_WALL_OFFSET = time.time() - time.monotonic()
 
-def _build_message(level, text):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return f"[{timestamp}] [{level}] {text}"
\ No newline at end of file
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+_dropped = 0
+_rate_state = {}
+
+_config = {
+    'console': True,
+    'json_path': None,
+}
+
+### API pubblica ###
+
+def info(text, stage=None, **fields):
+    _enqueue('INFO', text, stage, fields)
+
+def success(text, stage=None, **fields):
+    _enqueue('SUCCESS', text, stage, fields)
+
+def error(text, stage=None, **fields):
+    _enqueue('ERROR', text, stage, fields)
+
+def warning(text, stage=None, **fields):
+    _enqueue('WARNING', text, stage, fields)
+
+def rate_limited(level, key, text, interval=1.0, stage=None, **fields):
+    """
+    Per eventi ripetuti ad ogni frame: emette al massimo un record ogni `interval`
+    secondi per `key`. Le occorrenze soppresse vengono contate e riportate nel
+    record successivo (campo `suppressed`).
+    """
+    now = time.monotonic()
+    state = _rate_state.get(key)
+    if state is not None and now - state[0] < interval:
+        state[1] += 1
+        return
+
+    suppressed = state[1] if state is not None else 0
+    _rate_state[key] = [now, 0]
+    if suppressed:
+        fields['suppressed'] = suppressed
+    _enqueue(level.upper(), text, stage, fields, now)
+
+def configure(console=True, json_path=None):
+    """Imposta le destinazioni: console (colorata) e/o file JSON-lines."""
+    flush()
+    _config['console'] = console
+    _config['json_path'] = json_path
+
+def flush(timeout=1.0):
+    """Attende che il writer abbia scritto tutti i record accodati finora."""
+    if _writer is None or not _writer.is_alive():
+        return
+    done = threading.Event()
+    _queue.put(done)
+    done.wait(timeout)
+
+### Interni ###
+
+def _enqueue(level, text, stage, fields, timestamp=None):
+    global _dropped
+    if _queue.qsize() >= MAX_PENDING:
+        _dropped += 1
+        return
+
+    _queue.put((level, time.monotonic() if timestamp is None else timestamp, stage, text, fields))
+    if _writer is None:
+        _start_writer()
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop, name='log-writer', daemon=True)
+            _writer.start()
+
+def _writer_loop():
+    json_file, json_path = None, None
+    formatter = _TimestampFormatter()
+
+    while True:
+        batch = [_queue.get()]
+        # Svuota tutto ciò che è già in coda: una sola flush per lotto
+        try:
+            while len(batch) < 512:
+                batch.append(_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if _config['json_path'] != json_path:
+            if json_file is not None:
+                json_file.close()
+            json_path = _config['json_path']
+            json_file = None
+            if json_path:
+                # Un file non apribile disattiva solo l'output JSON: la console resta attiva
+                try:
+                    json_file = open(json_path, 'a', encoding='utf-8')
+                except OSError as e:
+                    _write(('ERROR', time.monotonic(), 'log', f"Impossibile aprire il log JSON {json_path}: {e}", {}),
+                           formatter, None)
+
+        waiters = []
+        for record in batch:
+            if isinstance(record, threading.Event):
+                waiters.append(record)
+                continue
+            if record is None:
+                _close(json_file)
+                for event in waiters:
+                    event.set()
+                return
+            # Un record non scrivibile si perde, il thread di scrittura resta vivo
+            try:
+                _write(record, formatter, json_file)
+            except Exception:
+                pass
+
+        try:
+            _report_dropped(formatter, json_file)
+        except Exception:
+            pass
+        _flush(sys.stdout)
+        _flush(json_file)
+        for event in waiters:
+            event.set()
+
+def _flush(stream):
+    # stdout è None con pythonw su Windows; una pipe chiusa solleva OSError
+    if stream is None:
+        return
+    try:
+        stream.flush()
+    except (OSError, ValueError):
+        pass
+
+def _write(record, formatter, json_file):
+    level, mono, stage, text, fields = record
+
+    if _config['console'] and sys.stdout is not None:
+        line = _build_message(level, text, formatter.format(mono), stage, fields)
+        color = _LEVEL_COLORS.get(level)
+        try:
+            sys.stdout.write(f"{color}{line}{ColorEnum.RESET}\n" if color else f"{line}\n")
+        except (OSError, ValueError):
+            # Console non scrivibile: il record va comunque nel file JSON
+            pass
+
+    if json_file is not None:
+        entry = {
+            'time': _WALL_OFFSET + mono,
+            'monotonic': mono,
+            'level': level,
+            'stage': stage,
+            'message': str(text),
+        }
+        entry.update(fields)
+        json_file.write(json.dumps(entry, default=str) + "\n")
+
+def _report_dropped(formatter, json_file):
+    global _dropped
+    if _dropped:
+        dropped, _dropped = _dropped, 0
+        _write(('WARNING', time.monotonic(), 'log', f"{dropped} messaggi di log scartati (coda piena)", {}),
+               formatter, json_file)
+
+def _close(json_file):
+    _flush(sys.stdout)
+    if json_file is not None:
+        try:
+            json_file.close()
+        except OSError:
+            pass
+
+def _shutdown():
+    if _writer is not None and _writer.is_alive():
+        _queue.put(None)
+        _writer.join(timeout=1.0)
+
+atexit.register(_shutdown)
+
+class _TimestampFormatter:
+    """Formatta l'orario con strftime al massimo una volta al secondo."""
+    def __init__(self):
+        self._second = None
+        self._text = ""
+
+    def format(self, mono):
+        second = int(_WALL_OFFSET + mono)
+        if second != self._second:
+            self._second = second
+            self._text = datetime.fromtimestamp(second).strftime("%Y-%m-%d %H:%M:%S")
+        return self._text
+
+def _build_message(level, text, timestamp, stage=None, fields=None):
+    prefix = f"[{timestamp}] [{level}]"
+    if stage:
+        prefix += f" [{stage}]"
+    message = f"{prefix} {text}"
+    if fields:
+        message += " " + " ".join(f"{k}={_format_value(v)}" for k, v in fields.items())
+    return message
+
+def _format_value(value):
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
@@ -0,0 +1,153 @@
+import torch
+import torch.nn.functional as F
+
+import utils.logutils as log
+
+# ==========================================
+# Stadi di post-processing (tensori B x C x H x W in [0, 1])
+# ==========================================
+
+class Feedback:
+    """
+    Feedback temporale con tensore persistente del frame precedente.
+    - mode='trails': out = max(x, prev * decay)  -> scie luminose
+    - mode='blend' : out = lerp(x, prev, decay)  -> motion blur / eco
+    """
+    def __init__(self, decay=0.85, mode='trails'):
+        self.decay = decay
+        self.mode = mode
+        self.prev = None
+
+    def reset(self):
+        self.prev = None
+
+    def __call__(self, x):
+        if self.prev is None or self.prev.shape != x.shape:
+            self.prev = x.clone()
+            return x
+
+        if self.mode == 'trails':
+            out = torch.maximum(x, self.prev.mul_(self.decay))
+        else:
+            out = torch.lerp(x, self.prev, self.decay)
+
+        self.prev.copy_(out)
+        return out
+
+
+class ColorGrade:
+    """
+    Color grading: luminosità, contrasto e saturazione fusi in un'unica
+    trasformazione affine 3x3 (una conv 1x1), poi gamma e LUT 3D opzionale (.cube).
+    """
+    def __init__(self, brightness=0.0, contrast=1.0, saturation=1.0, gamma=1.0, lut_path=None, device='cpu'):
+        self.gamma = gamma
+        self.weight, self.bias = self._build_affine(brightness, contrast, saturation, device)
+        self.lut = load_cube_lut(lut_path, device) if lut_path else None
+
+    @staticmethod
+    def _build_affine(brightness, contrast, saturation, device):
+        # Saturazione: interpolazione tra luminanza (Rec.709) e colore originale
+        luma = torch.tensor([0.2126, 0.7152, 0.0722])
+        sat = (1 - saturation) * luma.expand(3, 3) + saturation * torch.eye(3)
+        # Contrasto attorno al grigio medio + luminosità
+        matrix = contrast * sat
+        bias = torch.full((3,), 0.5 * (1 - contrast) + brightness)
+        return matrix[:, :, None, None].to(device), bias.to(device)
+
+    def __call__(self, x):
+        if x.shape[1] != 3:
+            return x
+
+        x = F.conv2d(x, self.weight.to(x.dtype), self.bias.to(x.dtype)).clamp_(0, 1)
+
+        if self.gamma != 1.0:
+            x = x.pow_(1.0 / self.gamma)
+
+        if self.lut is not None:
+            # grid_sample 5D = interpolazione trilineare nella LUT; coordinate (r, g, b) -> (W, H, D)
+            grid = (x.permute(0, 2, 3, 1) * 2 - 1).unsqueeze(1)
+            lut = self.lut.to(x.dtype).expand(x.shape[0], -1, -1, -1, -1)
+            x = F.grid_sample(lut, grid, mode='bilinear', padding_mode='border', align_corners=True).squeeze(2)
+
+        return x
+
+
+class Upscale:
+    """Upscaling veloce via interpolazione (bilinear/bicubic/nearest)."""
+    def __init__(self, scale=2, mode='bilinear'):
+        self.scale = scale
+        self.mode = mode
+
+    def __call__(self, x):
+        if self.scale == 1:
+            return x
+        align = False if self.mode in ('bilinear', 'bicubic') else None
+        x = F.interpolate(x, scale_factor=self.scale, mode=self.mode, align_corners=align)
+        return x.clamp_(0, 1) if self.mode == 'bicubic' else x
+
+# ==========================================
+# Catena
+# ==========================================
+
+class PostFXChain:
+    """
+    Catena di stadi applicata all'uscita del `Generator` (in [-1, 1]) prima
+    della conversione in uint8 e del trasferimento `.cpu()`. Restituisce [0, 1].
+    """
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def reset(self):
+        for stage in self.stages:
+            if hasattr(stage, 'reset'):
+                stage.reset()
+
+    def __call__(self, generated_tensor):
+        x = (generated_tensor.clamp(-1, 1) + 1) / 2
+        for stage in self.stages:
+            x = stage(x)
+        return x
+
+
+def build_post_fx(device, upscale=1, feedback=0.0, feedback_mode='trails', lut_path=None,
+                  brightness=0.0, contrast=1.0, saturation=1.0, gamma=1.0):
+    """
+    Crea la catena standard. Feedback e grading precedono l'upscaling:
+    lavorano alla risoluzione nativa, quindi su meno pixel.
+    """
+    stages = []
+    if feedback > 0:
+        stages.append(Feedback(decay=feedback, mode=feedback_mode))
+    if lut_path or (brightness, contrast, saturation, gamma) != (0.0, 1.0, 1.0, 1.0):
+        stages.append(ColorGrade(brightness, contrast, saturation, gamma, lut_path=lut_path, device=device))
+    if upscale > 1:
+        stages.append(Upscale(scale=upscale))
+
+    log.info(f"Post FX: {[type(stage).__name__ for stage in stages] or 'nessuno stadio'}")
+    return PostFXChain(stages)
+
+
+def load_cube_lut(path, device='cpu'):
+    """
+    Carica una LUT 3D in formato .cube (Adobe/Resolve).
+    Restituisce un tensore (1, 3, N, N, N) ordinato come (C, B, G, R) per `grid_sample`.
+    """
+    size = None
+    values = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('LUT_3D_SIZE'):
+                size = int(line.split()[1])
+            elif line[0].isdigit() or line[0] in '-.':
+                values.append([float(v) for v in line.split()[:3]])
+
+    if size is None or len(values) != size ** 3:
+        raise ValueError(f"LUT .cube non valida: {path}")
+
+    # Nel formato .cube il rosso varia più velocemente: l'ordine dei dati è [b][g][r]
+    lut = torch.tensor(values, dtype=torch.float32).view(size, size, size, 3)
+    return lut.permute(3, 0, 1, 2).unsqueeze(0).contiguous().to(device)
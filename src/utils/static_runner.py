@@ -0,0 +1,157 @@
+import torch
+import torch.nn.functional as F
+
+from utils.lightweight_gan_cust import Noise, exists
+import utils.logutils as log
+
+# ==========================================
+# Banco di rumore pre-generato
+# ==========================================
+
+class NoiseBank:
+    """
+    Rumore pre-generato per un singolo layer `Noise`: `bank_size` campioni
+    (b, 1, h, w) serviti a rotazione nel buffer statico `slot`.
+    Con `refill=True` il banco viene rigenerato in blocco ad ogni giro completo.
+    """
+    def __init__(self, shape, bank_size, device, refill = False):
+        self.bank = torch.randn(bank_size, *shape, device = device)
+        self.slot = torch.empty(shape, device = device)
+        self.refill = refill
+        self.index = 0
+
+    def advance(self):
+        self.slot.copy_(self.bank[self.index])
+        self.index += 1
+        if self.index == self.bank.shape[0]:
+            self.index = 0
+            if self.refill:
+                self.bank.normal_()
+
+# ==========================================
+# Runner a memoria statica
+# ==========================================
+
+class StaticGeneratorRunner:
+    """
+    Esegue il `Generator` con (batch, image_size) fissi riusando i buffer frame dopo frame:
+    - latente di ingresso e uscita in buffer statici;
+    - rumore per layer servito da `NoiseBank` invece di `torch.randn` ad ogni frame;
+    - mappa delle residue SLE pre-calcolata (niente dict ricostruito ad ogni chiamata);
+    - operazioni elementwise (noise, SLE, residuo attention) eseguite in-place.
+
+    Su CUDA il forward viene catturato in un CUDA Graph: le attivazioni intermedie
+    vivono nel pool privato del grafo e il replay non esegue allocazioni.
+    Su CPU (esecuzione eager) le uscite di conv, BatchNorm e GLU restano allocate ad
+    ogni frame: si risparmiano solo rumore, mappa SLE e i temporanei delle operazioni in-place.
+    Il tensore restituito è un buffer statico: va consumato prima della chiamata successiva.
+    """
+    def __init__(self, model, batch_size = 1, noise_bank_size = 64, refill_noise = False, use_cuda_graph = True):
+        self.model = model
+        self.device = next(model.parameters()).device
+        self.batch_size = batch_size
+        latent_dim = model.initial_conv[0].in_channels
+
+        self.static_z = torch.zeros(batch_size, latent_dim, device = self.device)
+        self.static_out = None
+        self.graph = None
+
+        self.noise_banks = self._plan_noise(noise_bank_size, refill_noise)
+
+        # Slot delle residue SLE indicizzati per risoluzione
+        max_res = max(model.res_layers) + 2
+        self._residuals = [None] * (max_res + 1)
+
+        if use_cuda_graph and self.device.type == 'cuda':
+            self._capture_graph()
+
+    def _plan_noise(self, bank_size, refill):
+        """Ricava la forma dell'ingresso di ogni layer `Noise` con un forward di prova."""
+        noise_layers = [m for m in self.model.modules() if isinstance(m, Noise)]
+        shapes = {}
+        hooks = [m.register_forward_pre_hook(lambda mod, args: shapes.__setitem__(mod, args[0].shape))
+                 for m in noise_layers]
+
+        # eval: il forward di prova non deve alterare le statistiche di BatchNorm
+        was_training = self.model.training
+        self.model.eval()
+        with torch.no_grad():
+            self.model(self.static_z)
+        self.model.train(was_training)
+
+        for hook in hooks:
+            hook.remove()
+
+        banks = []
+        for layer in noise_layers:
+            b, _, h, w = shapes[layer]
+            bank = NoiseBank((b, 1, h, w), bank_size, self.device, refill = refill)
+            layer.noise_buffer = bank.slot
+            banks.append(bank)
+        return banks
+
+    def _forward(self):
+        model = self.model
+        residuals = self._residuals
+
+        x = model.initial_conv(self.static_z[:, :, None, None])
+        x = F.normalize(x, dim = 1)
+
+        for (res, (up, sle, attn)) in zip(model.res_layers, model.layers):
+            if exists(attn):
+                x = attn(x).add_(x)
+
+            x = up(x)
+
+            if exists(sle):
+                residuals[model.sle_map[res]] = sle(x)
+
+            residual = residuals[res + 1]
+            if exists(residual):
+                x = x.mul_(residual)
+                residuals[res + 1] = None
+
+        return model.out_conv(x)
+
+    def _capture_graph(self):
+        try:
+            # Warmup su uno stream laterale (richiesto prima della cattura)
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream), torch.no_grad():
+                for _ in range(3):
+                    self._advance_noise()
+                    self._forward()
+            torch.cuda.current_stream().wait_stream(stream)
+
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph), torch.no_grad():
+                self.static_out = self._forward()
+            self.graph = graph
+            log.info("Static Runner: forward catturato in un CUDA Graph.")
+        except RuntimeError as e:
+            self.graph = None
+            self.static_out = None
+            log.warning(f"Static Runner: cattura CUDA Graph fallita, esecuzione eager: {e}")
+
+    def _advance_noise(self):
+        for bank in self.noise_banks:
+            bank.advance()
+
+    def release(self):
+        """Ripristina il comportamento originale dei layer `Noise`."""
+        for m in self.model.modules():
+            if isinstance(m, Noise):
+                m.noise_buffer = None
+        self.graph = None
+
+    def __call__(self, z):
+        self.static_z.copy_(z)
+        self._advance_noise()
+
+        if exists(self.graph):
+            self.graph.replay()
+            return self.static_out
+
+        with torch.no_grad():
+            return self._forward()